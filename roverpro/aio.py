@@ -0,0 +1,251 @@
+"""An asyncio compatibility shim for the Trio driver.
+
+async def main():
+    async with open_rover() as rover:
+        rover.set_motor_speeds(0.5, 0.5, 0)
+        print(await rover.get_data(14))
+        async with rover.subscribe({14: 50}) as subscription:
+            async for sample in subscription:
+                ...
+
+asyncio.run(main())
+
+The driver runs as a Trio guest on the asyncio event loop (see trio.lowlevel.start_guest_run):
+its tasks take turns with asyncio's on the event loop's thread, so calls don't hop to a Trio run in
+another thread. Serial I/O is still Trio's, and each wait for the serial device goes through
+Trio's helper thread.
+"""
+
+import asyncio
+import inspect
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import trio
+from async_generator import asynccontextmanager
+
+from . import rover as trio_rover
+from .rover import DataBatch, DataItems, Rover, Snapshot
+from .subscription import DataSample, Subscription
+
+
+class _TrioGuest:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        """Runs an open Rover in a Trio guest run on the given asyncio event loop, and runs
+        calls on it from asyncio"""
+        self._loop = loop
+        self._started = loop.create_future()
+        self._done = loop.create_future()
+        self._token = None  # type: Optional[trio.lowlevel.TrioToken]
+        self._nursery = None  # type: Optional[trio.Nursery]
+        self._cancel_scope = trio.CancelScope()
+        self.rover = None  # type: Optional[Rover]
+
+    def start(self, path_to_serial, kwargs):
+        trio.lowlevel.start_guest_run(
+            self._main,
+            path_to_serial,
+            kwargs,
+            run_sync_soon_threadsafe=self._loop.call_soon_threadsafe,
+            run_sync_soon_not_threadsafe=self._loop.call_soon,
+            done_callback=self._on_done,
+        )
+
+    async def _main(self, path_to_serial, kwargs):
+        self._token = trio.lowlevel.current_trio_token()
+        with self._cancel_scope:
+            async with trio_rover.open_rover(path_to_serial, **kwargs) as rover:
+                async with trio.open_nursery() as nursery:
+                    self.rover = rover
+                    self._nursery = nursery
+                    if not self._started.done():
+                        self._started.set_result(None)
+                    await trio.sleep_forever()
+
+    def _on_done(self, outcome):
+        try:
+            outcome.unwrap()
+        except BaseException as e:
+            if not self._started.done():
+                # report it to whoever is waiting for the rover to open
+                self._started.set_exception(e)
+                self._done.set_result(None)
+            else:
+                self._done.set_exception(e)
+        else:
+            if not self._started.done():
+                self._started.cancel()
+            self._done.set_result(None)
+
+    async def wait_started(self):
+        await self._started
+
+    async def stop(self):
+        """Close the rover and wait for the guest run to finish"""
+        if not self._done.done():
+            self._token.run_sync_soon(self._cancel_scope.cancel)
+        await asyncio.shield(self._done)
+
+    def call_soon(self, fn: Callable, *args):
+        """Call a synchronous function in the guest run, without waiting for it.
+        It must not raise. Raises RuntimeError if the rover is closed."""
+        try:
+            self._token.run_sync_soon(fn, *args)
+        except trio.RunFinishedError:
+            raise RuntimeError("The rover is closed") from None
+
+    async def call(self, fn: Callable, *args) -> Any:
+        """Call fn(*args) in the guest run, await the result if it is awaitable, and return it.
+        Cancelling the calling asyncio task cancels the call.
+        Raises RuntimeError if the rover is closed before the call finishes."""
+        future = self._loop.create_future()
+        cancel_scope = trio.CancelScope()
+        self.call_soon(self._start_call, future, cancel_scope, fn, args)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            try:
+                self._token.run_sync_soon(cancel_scope.cancel)
+            except trio.RunFinishedError:
+                pass
+            raise
+
+    def _start_call(self, future: asyncio.Future, cancel_scope: trio.CancelScope, fn, args):
+        try:
+            self._nursery.start_soon(self._run_call, future, cancel_scope, fn, args)
+        except RuntimeError:
+            # the nursery is closed because the rover is closing
+            if not future.done():
+                future.set_exception(RuntimeError("The rover is closed"))
+
+    @staticmethod
+    async def _run_call(future: asyncio.Future, cancel_scope: trio.CancelScope, fn, args):
+        try:
+            with cancel_scope:
+                result = fn(*args)
+                if inspect.isawaitable(result):
+                    result = await result
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            if not future.done():
+                if cancel_scope.cancel_called:
+                    future.cancel()
+                else:
+                    future.set_exception(RuntimeError("The rover is closed"))
+
+
+class AsyncioSubscription:
+    def __init__(self, guest: _TrioGuest, rates: Dict[int, float], buffer_size: int):
+        """An asyncio view of a Subscription. Use as an async context manager, then iterate over
+        it with `async for`"""
+        self._guest = guest
+        self._rates = rates
+        self._buffer_size = buffer_size
+        self.subscription = None  # type: Optional[Subscription]
+
+    async def __aenter__(self):
+        self.subscription = await self._guest.call(
+            self._guest.rover.subscribe, self._rates, self._buffer_size
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self):
+        if self.subscription is not None:
+            try:
+                self._guest.call_soon(self.subscription.close)
+            except RuntimeError:
+                # closing the rover already closed its subscriptions
+                pass
+
+    async def receive(self) -> DataSample:
+        """As Subscription.receive"""
+        return await self._guest.call(self.subscription.receive)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> DataSample:
+        try:
+            return await self.receive()
+        except trio.EndOfChannel:
+            raise StopAsyncIteration from None
+
+
+class AsyncioRover:
+    def __init__(self, guest: _TrioGuest):
+        """An asyncio view of a Rover. Its methods are like Rover's, but are called from asyncio.
+        Anything else can be run on the underlying `rover` with `call`."""
+        self._guest = guest
+        self.rover = guest.rover
+
+    @property
+    def firmware_version(self):
+        return self.rover.firmware_version
+
+    async def call(self, fn: Callable, *args) -> Any:
+        """Call fn(*args) in the driver's Trio guest run, awaiting it if it is async, and return
+        the result. Use this for anything which uses Trio, e.g. call(rover.metrics)."""
+        return await self._guest.call(fn, *args)
+
+    def set_motor_speeds(self, left, right, flipper):
+        assert -1 <= left <= 1
+        assert -1 <= right <= 1
+        assert -1 <= flipper <= 1
+        self._guest.call_soon(self.rover.set_motor_speeds, left, right, flipper)
+
+    def set_fan_speed(self, fan_speed):
+        assert 0 <= fan_speed <= 1
+        self._guest.call_soon(self.rover.set_fan_speed, fan_speed)
+
+    def clear_system_fault(self):
+        self._guest.call_soon(self.rover.clear_system_fault)
+
+    def flipper_calibrate(self):
+        self._guest.call_soon(self.rover.flipper_calibrate)
+
+    async def get_data(self, index, max_age: Optional[float] = None) -> Any:
+        return await self.call(self.rover.get_data, index, max_age)
+
+    async def get_data_items(
+        self, indices: Iterable[int], timeout: float = 1, max_age: Optional[float] = None
+    ) -> DataItems:
+        return await self.call(self.rover.get_data_items, indices, timeout, max_age)
+
+    async def get_data_batch(
+        self, batch: DataBatch, timeout: float = 1, max_age: Optional[float] = None
+    ) -> DataBatch:
+        return await self.call(self.rover.get_data_batch, batch, timeout, max_age)
+
+    async def snapshot(
+        self, elements: Optional[Iterable[int]] = None, timeout: float = 1
+    ) -> Snapshot:
+        return await self.call(self.rover.snapshot, elements, timeout)
+
+    async def metrics(self) -> Dict[str, Any]:
+        return await self.call(self.rover.metrics)
+
+    def subscribe(self, rates: Dict[int, float], buffer_size: int = 100) -> AsyncioSubscription:
+        """As Rover.subscribe, but use the result with `async with`"""
+        return AsyncioSubscription(self._guest, rates, buffer_size)
+
+
+@asynccontextmanager
+async def open_rover(path_to_serial: Optional[str] = None, capture=None, tracer=None):
+    """Connect to a rover from asyncio. Takes the same arguments as roverpro.open_rover.
+    Must be called from a running asyncio event loop with no Trio run already in its thread.
+    Requires Python 3.7 or later.
+    :return: An AsyncioRover
+    """
+    guest = _TrioGuest(asyncio.get_running_loop())
+    guest.start(path_to_serial, dict(capture=capture, tracer=tracer))
+    try:
+        await guest.wait_started()
+        yield AsyncioRover(guest)
+    finally:
+        await guest.stop()
@@ -0,0 +1,202 @@
+"""Benchmarks of the protocol hot path, runnable without rover hardware.
+
+    python -m roverpro.benchmark --output results.json
+
+Microbenchmarks time encoding and decoding in isolation. End-to-end benchmarks run the full
+driver against a simulated rover (roverpro.sim), so they require pseudo-terminal support.
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import timeit
+from typing import Any, Callable, Dict, List, Sequence
+
+import trio
+
+from .capture import FrameCapture
+from .rover import open_rover
+from .rover_data import ROVER_DATA_DECODERS, ROVER_DATA_ELEMENTS, RoverFirmwareVersion
+from .rover_protocol import checksum, CommandEncoder, CommandVerb, encode_packet, RoverProtocol
+from .sim import open_rover_simulator
+
+SIMULATOR_VERSION = RoverFirmwareVersion(1, 10)
+
+
+def percentile(sorted_values: Sequence[float], p: float) -> float:
+    """The p-th percentile (0-100) of already-sorted values, by linear interpolation"""
+    if not sorted_values:
+        return math.nan
+    k = (len(sorted_values) - 1) * p / 100
+    lo = math.floor(k)
+    hi = math.ceil(k)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        "n": len(latencies),
+        "p50_s": percentile(latencies, 50),
+        "p90_s": percentile(latencies, 90),
+        "p99_s": percentile(latencies, 99),
+        "max_s": latencies[-1] if latencies else math.nan,
+    }
+
+
+def time_per_call(fn: Callable[[], Any], number: int) -> float:
+    """Seconds per call of fn, best of 3 runs"""
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number
+
+
+class _FramesSource:
+    """Stands in for SerialTrio, handing RoverProtocol the same bytes over and over"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def receive_some(self):
+        return self.data
+
+
+def _sample_frames() -> List[bytes]:
+    frames = []
+    for index, element in ROVER_DATA_ELEMENTS.items():
+        if element.supported(SIMULATOR_VERSION):
+            frames.append(encode_packet(bytes([index]), bytes(2)))
+    return frames
+
+
+async def _time_read_one(n_frames: int) -> float:
+    frames = _sample_frames()
+    protocol = RoverProtocol(_FramesSource(b"".join(frames)))
+    t0 = time.perf_counter()
+    for _ in range(n_frames):
+        await protocol.read_one()
+    return (time.perf_counter() - t0) / n_frames
+
+
+async def _time_read_many(n_frames: int) -> float:
+    frames = _sample_frames()
+    protocol = RoverProtocol(_FramesSource(b"".join(frames * 10)))
+    n_decoded = 0
+    t0 = time.perf_counter()
+    while n_decoded < n_frames:
+        n_decoded += len(await protocol.read_many())
+    return (time.perf_counter() - t0) / n_decoded
+
+
+def run_microbenchmarks(number: int = 10000) -> Dict[str, float]:
+    """Seconds per operation for each hot-path function"""
+    payload = bytes([40, 0x28, 0x6E])
+    encoder = CommandEncoder()
+    # more distinct arguments than the encoder's frame cache holds
+    args = itertools.cycle(range(CommandEncoder.FRAME_CACHE_SIZE * 2))
+    results = {
+        "encode_packet": time_per_call(
+            lambda: encode_packet(b"\x7d", b"\x7d", b"\x7d", bytes([CommandVerb.GET_DATA, 40])),
+            number,
+        ),
+        "checksum": time_per_call(lambda: checksum(payload), number),
+        "CommandEncoder.encode (repeated frame)": time_per_call(
+            lambda: encoder.encode(0.5, 0.5, 0, CommandVerb.GET_DATA, 40), number
+        ),
+        "CommandEncoder.encode (new frame, same motors)": time_per_call(
+            lambda: encoder.encode(0.5, 0.5, 0, CommandVerb.GET_DATA, next(args)), number
+        ),
+        "RoverProtocol.read_one": trio.run(_time_read_one, number),
+        "RoverProtocol.read_many (per frame)": trio.run(_time_read_many, number),
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with FrameCapture(os.path.join(tmp_dir, "benchmark.cap"), capacity=1024) as capture:
+            frame = encoder.encode(0.5, 0.5, 0, CommandVerb.GET_DATA, 40)
+            results["FrameCapture.record_outbound"] = time_per_call(
+                lambda: capture.record_outbound(frame), number
+            )
+    for index, element in ROVER_DATA_ELEMENTS.items():
+        data_format = element.data_format
+        sample = ({72: b"\x00\x10", 74: b"\x00\x10", 76: b"\x00\x10"}).get(index, b"\x00\x01")
+        results[f"unpack[{index}] {type(data_format).__name__}"] = time_per_call(
+            lambda: data_format.unpack(sample), number
+        )
+        decoder = ROVER_DATA_DECODERS[index]
+        results[f"decoder[{index}] {type(data_format).__name__}"] = time_per_call(
+            lambda: decoder(sample), number
+        )
+    return results
+
+
+async def run_end_to_end(
+    n_requests: int = 1000, latency: float = 0.0, items: Sequence[int] = (14, 16, 28, 30)
+) -> Dict[str, Any]:
+    """Latency and throughput of the full driver against a simulated rover"""
+    results = {}
+    async with open_rover_simulator(version=SIMULATOR_VERSION, latency=latency) as sim:
+        async with open_rover(sim.path) as rover:
+            latencies = []
+            t_start = trio.current_time()
+            for _ in range(n_requests):
+                t0 = trio.current_time()
+                await rover.get_data(14)
+                latencies.append(trio.current_time() - t0)
+            elapsed = trio.current_time() - t_start
+            results["get_data"] = dict(summarize(latencies), requests_per_s=n_requests / elapsed)
+
+            latencies = []
+            n_calls = max(1, n_requests // len(items))
+            t_start = trio.current_time()
+            for _ in range(n_calls):
+                t0 = trio.current_time()
+                await rover.get_data_items(items)
+                latencies.append(trio.current_time() - t0)
+            elapsed = trio.current_time() - t_start
+            results["get_data_items"] = dict(
+                summarize(latencies),
+                items_per_call=len(items),
+                requests_per_s=n_calls * len(items) / elapsed,
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", "-o", help="write JSON results to this file (default stdout)")
+    parser.add_argument(
+        "--number", type=int, default=10000, help="iterations of each microbenchmark"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=1000, help="requests for each end-to-end benchmark"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="simulated rover response latency (seconds)"
+    )
+    parser.add_argument(
+        "--micro-only", action="store_true", help="skip benchmarks that need a simulated rover"
+    )
+    args = parser.parse_args()
+
+    results = {
+        "python": sys.version,
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "micro_s_per_op": run_microbenchmarks(args.number),
+    }
+    if not args.micro_only:
+        results["end_to_end"] = trio.run(run_end_to_end, args.requests, args.latency)
+
+    text = json.dumps(results, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Record every frame to and from a rover, and play recordings back.
+
+with FrameCapture("rover.cap") as capture:
+    async with open_rover(capture=capture) as rover:
+        ...
+
+frames = read_capture("rover.cap")
+protocol = RoverProtocol(ReplaySerial(frames, speed=10))
+
+columns = load_columns("rover.cap")  # requires NumPy
+
+Frames are kept in a fixed-size memory-mapped ring file, so recording costs no system calls and
+the newest frames survive the process crashing.
+"""
+
+import enum
+import math
+import mmap
+import struct
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import trio
+
+from .rover_data import import_numpy, ROVER_DATA_ELEMENTS
+from .rover_protocol import encode_packet
+
+# magic, format version, record size, capacity, number of frames ever recorded,
+# time.time() and time.monotonic() when the capture was created
+_HEADER = struct.Struct("<8sHHIQdd")
+_HEADER_SIZE = 64
+_COUNT = struct.Struct("<Q")
+_COUNT_OFFSET = 16
+_MAGIC = b"RVRCAP\x00\x00"
+_FORMAT_VERSION = 1
+
+# timestamp, direction, then the frame without its start byte and checksum
+_RECORD_SIZE = 16
+_OUTBOUND_RECORD = struct.Struct("<dBBBBBB2x")
+_INBOUND_RECORD = struct.Struct("<dBBBB4x")
+_RECORD = struct.Struct("<dB5s2x")
+
+
+class FrameDirection(enum.IntEnum):
+    TO_ROVER = 1
+    FROM_ROVER = 2
+
+
+class CapturedFrame(NamedTuple):
+    # time.monotonic() when the frame was sent or received
+    timestamp: float
+    direction: FrameDirection
+    # the frame without its start byte and checksum. 5 bytes to the rover, 3 bytes from it
+    payload: bytes
+
+    def encode(self) -> bytes:
+        """The frame as it was sent over the wire"""
+        return encode_packet(self.payload)
+
+
+class FrameCapture:
+    def __init__(self, path: str, capacity: int = 1 << 20):
+        """Record frames into a new ring file at path, which holds the newest `capacity` frames.
+        Use as a context manager, or call close() when done."""
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.path = path
+        self.capacity = capacity
+        # number of frames ever recorded
+        self.count = 0
+        size = _HEADER_SIZE + capacity * _RECORD_SIZE
+        with open(path, "w+b") as f:
+            f.truncate(size)
+            self._mmap = mmap.mmap(f.fileno(), size)
+        _HEADER.pack_into(
+            self._mmap,
+            0,
+            _MAGIC,
+            _FORMAT_VERSION,
+            _RECORD_SIZE,
+            capacity,
+            0,
+            time.time(),
+            time.monotonic(),
+        )
+
+    def record_outbound(self, frame: bytes):
+        """Record a 7-byte command frame sent to the rover"""
+        count = self.count
+        offset = _HEADER_SIZE + count % self.capacity * _RECORD_SIZE
+        _OUTBOUND_RECORD.pack_into(
+            self._mmap,
+            offset,
+            time.monotonic(),
+            FrameDirection.TO_ROVER,
+            frame[1],
+            frame[2],
+            frame[3],
+            frame[4],
+            frame[5],
+        )
+        self.count = count + 1
+        _COUNT.pack_into(self._mmap, _COUNT_OFFSET, count + 1)
+
+    def record_inbound(self, frames: Iterable[Tuple[int, bytes]]):
+        """Record (data element index, 2-byte payload) frames received from the rover"""
+        mm = self._mmap
+        capacity = self.capacity
+        count = self.count
+        now = time.monotonic()
+        for index, payload in frames:
+            offset = _HEADER_SIZE + count % capacity * _RECORD_SIZE
+            _INBOUND_RECORD.pack_into(
+                mm, offset, now, FrameDirection.FROM_ROVER, index, payload[0], payload[1]
+            )
+            count += 1
+        self.count = count
+        _COUNT.pack_into(mm, _COUNT_OFFSET, count)
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _read_header(path: str, data: bytes) -> Tuple[int, int]:
+    """The capacity and number of frames ever recorded of a capture file"""
+    if len(data) < _HEADER_SIZE:
+        raise ValueError(f"{path} is not a rover frame capture")
+    magic, version, record_size, capacity, count, _, _ = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _FORMAT_VERSION or record_size != _RECORD_SIZE:
+        raise ValueError(f"{path} is not a rover frame capture")
+    return capacity, count
+
+
+def read_capture(path: str) -> List[CapturedFrame]:
+    """The frames in a capture file, oldest first. The file may still be being recorded into."""
+    with open(path, "rb") as f:
+        data = f.read()
+    capacity, count = _read_header(path, data)
+    first = max(0, count - capacity)
+    frames = []
+    for i in range(first, count):
+        timestamp, direction, payload = _RECORD.unpack_from(
+            data, _HEADER_SIZE + i % capacity * _RECORD_SIZE
+        )
+        direction = FrameDirection(direction)
+        if direction == FrameDirection.FROM_ROVER:
+            payload = payload[:3]
+        frames.append(CapturedFrame(timestamp, direction, payload))
+    return frames
+
+
+class Column(NamedTuple):
+    """Every value of one data element in a capture, as NumPy arrays"""
+
+    # time.monotonic() when each value was received
+    timestamps: Any
+    # the values, as decoded by the data format's unpack_many
+    values: Any
+
+
+def load_columns(path: str) -> Dict[int, Column]:
+    """Decode every value received in a capture file, grouped by data element index.
+    Requires NumPy. Elements with any value that fails to decode are left out."""
+    np = import_numpy()
+    record_dtype = np.dtype(
+        {
+            "names": ["timestamp", "direction", "payload"],
+            "formats": ["<f8", "u1", ("u1", 5)],
+            "offsets": [0, 8, 9],
+            "itemsize": _RECORD_SIZE,
+        }
+    )
+    with open(path, "rb") as f:
+        capacity, count = _read_header(path, f.read(_HEADER_SIZE))
+        records = np.fromfile(f, dtype=record_dtype, count=capacity)
+    if capacity < count:
+        # oldest first
+        records = np.roll(records, -(count % capacity))
+    else:
+        records = records[:count]
+    records = records[records["direction"] == FrameDirection.FROM_ROVER]
+
+    # group frames by data element with one sort, keeping each group in time order
+    records = records[np.argsort(records["payload"][:, 0], kind="stable")]
+    indices = records["payload"][:, 0]
+    starts = np.flatnonzero(np.diff(indices, prepend=-1))
+    ends = np.append(starts[1:], len(records))
+    columns = {}
+    for start, end in zip(starts, ends):
+        index = int(indices[start])
+        element = ROVER_DATA_ELEMENTS.get(index)
+        if element is None:
+            continue
+        group = records[start:end]
+        try:
+            values = element.data_format.unpack_many(group["payload"][:, 1:3])
+        except ValueError:
+            continue
+        columns[index] = Column(group["timestamp"], values)
+    return columns
+
+
+class ReplaySerial:
+    # nothing written to a replay is ever waiting to be sent
+    out_waiting = 0
+
+    def __init__(self, frames: Iterable[CapturedFrame], speed: float = 1.0):
+        """Stands in for SerialTrio, delivering the frames received in a capture with the same
+        spacing in time, sped up by the given factor (math.inf for no delay at all).
+        Frames written to it are kept in `written`. Once all frames have been delivered,
+        receive_some raises trio.EndOfChannel."""
+        if not speed > 0:
+            raise ValueError("speed must be positive")
+        self.speed = speed
+        self._inbound = [f for f in frames if f.direction == FrameDirection.FROM_ROVER]
+        self._next = 0
+        # trio.current_time() and capture timestamp when replay started
+        self._start = None  # type: Optional[Tuple[float, float]]
+        self.written = []  # type: List[bytes]
+
+    async def receive_some(self) -> bytes:
+        inbound = self._inbound
+        if self._next == len(inbound):
+            await trio.lowlevel.checkpoint()
+            raise trio.EndOfChannel
+        if math.isinf(self.speed):
+            await trio.lowlevel.checkpoint()
+            due = math.inf
+        else:
+            if self._start is None:
+                self._start = (trio.current_time(), inbound[0].timestamp)
+            t0, timestamp0 = self._start
+            await trio.sleep_until(t0 + (inbound[self._next].timestamp - timestamp0) / self.speed)
+            # deliver every frame that is due by the time we woke up
+            due = timestamp0 + (trio.current_time() - t0) * self.speed
+        end = self._next + 1
+        while end < len(inbound) and inbound[end].timestamp <= due:
+            end += 1
+        data = b"".join(frame.encode() for frame in inbound[self._next : end])
+        self._next = end
+        return data
+
+    def write_nowait(self, data: bytes):
+        self.written.append(bytes(data))
+
+    async def flush(self, n_bytes=0):
+        await trio.lowlevel.checkpoint()
@@ -1,4 +1,6 @@
-from typing import Awaitable, Optional, Sequence
+import json
+import os
+from typing import Awaitable, Dict, List, Optional, Sequence, Tuple
 
 import trio
 from async_generator import asynccontextmanager
@@ -33,20 +35,152 @@ async def get_rover_protocol_version(device: SerialTrio,) -> Awaitable[RoverFirm
         raise RoverException("Device did not return a valid version", e) from e
 
 
+def default_port_cache_path() -> str:
+    """Where open_rover_device remembers which serial ports had rovers on them"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "roverpro", "ports.json")
+
+
+def _port_key(comport) -> str:
+    """An identifier for a serial device which survives it being unplugged and plugged back in"""
+    if comport.vid is not None and comport.serial_number:
+        return f"usb:{comport.vid:04x}:{comport.pid:04x}:{comport.serial_number}"
+    return comport.device
+
+
+def _load_port_cache(path: str) -> Dict[str, Dict[str, str]]:
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict):
+        return {}
+    # ignore anything unexpected, e.g. written by another version of this library
+    return {k: v for k, v in cache.items() if isinstance(v, dict) and "device" in v}
+
+
+def _save_port_cache(path: str, cache: Dict[str, Dict[str, str]]):
+    # the cache only speeds things up, so failing to write it is not an error
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def _update_port_cache(
+    path: str,
+    found: Optional[Tuple[str, str, RoverFirmwareVersion]] = None,
+    forget: Sequence[str] = (),
+):
+    """Record that the device with the given key, port, and version is a rover, and forget the
+    devices with the given keys"""
+    # reread the cache in case another task or process has updated it since we read it
+    cache = _load_port_cache(path)
+    new_cache = {k: e for k, e in cache.items() if k not in forget}
+    if found is not None:
+        key, port, version = found
+        # whatever was on this path before, it isn't there now
+        new_cache = {k: e for k, e in new_cache.items() if e["device"] != port}
+        new_cache[key] = {"device": port, "version": str(version)}
+    if new_cache != cache:
+        _save_port_cache(path, new_cache)
+
+
+async def _probe_ports(
+    ports: Sequence[str], failures: List[Tuple[str, Exception]]
+) -> Optional[Tuple[str, SerialTrio, RoverFirmwareVersion]]:
+    """Probe all the given ports at once. Return the first rover to respond, with its device still
+    open, or None if none did. Other devices are closed and their failures appended to failures."""
+    winner = None
+
+    async def probe(port):
+        nonlocal winner
+        try:
+            device = SerialTrio(port, **DEFAULT_SERIAL_KWARGS)
+        except RoverException as e:
+            failures.append((port, e))
+            return
+        try:
+            version = await get_rover_protocol_version(device)
+        except RoverException as e:
+            failures.append((port, e))
+        else:
+            if winner is None:
+                winner = (port, device, version)
+                nursery.cancel_scope.cancel()
+                return
+        finally:
+            if winner is None or winner[1] is not device:
+                await trio.aclose_forcefully(device)
+
+    async with trio.open_nursery() as nursery:
+        for port in ports:
+            nursery.start_soon(probe, port)
+    return winner
+
+
 @asynccontextmanager
-async def open_rover_device(*ports_to_try: Optional[str]):
+async def open_rover_device(
+    *ports_to_try: Optional[str], use_cache: bool = True, cache_path: Optional[str] = None
+):
     """
-    Enumerates serial devices until it finds one that responds to a request for Rover firmware version. Returns that device.
+    Probes serial devices until it finds one that responds to a request for Rover firmware version. Returns that device.
+    Candidate devices are probed all at once. When searching all FTDI devices, those which had a rover last time are probed first, wherever they are now attached.
     :param ports_to_try: if provided, the devices to attempt to open (e.g. 'COM3'). Otherwise, all FTDI devices will be attempted
+    :param use_cache: whether to read and update the record of which FTDI devices had rovers
+    :param cache_path: where that record is kept. Defaults to default_port_cache_path()
     :return: A SerialTrio device to use as a rover. If no appropriate device is found, will raise a RoverDeviceNotFound exception
     """
-    exc_args = []
-    for port in ports_to_try or get_ftdi_device_paths():
-        async with SerialTrio(port, **DEFAULT_SERIAL_KWARGS) as device:
-            try:
-                await get_rover_protocol_version(device)
-                yield device
-                return
-            except RoverException as e:
-                exc_args.append((port, e))
-    raise RoverDeviceNotFound(exc_args)
+    async with open_rover_device_with_version(
+        *ports_to_try, use_cache=use_cache, cache_path=cache_path
+    ) as (device, version):
+        yield device
+
+
+@asynccontextmanager
+async def open_rover_device_with_version(
+    *ports_to_try: Optional[str], use_cache: bool = True, cache_path: Optional[str] = None
+):
+    """As open_rover_device, but also gives the firmware version the rover reported when probed
+    :return: A tuple of the SerialTrio device and its RoverFirmwareVersion
+    """
+    failures = []  # type: List[Tuple[str, Exception]]
+    if ports_to_try:
+        found = await _probe_ports(ports_to_try, failures)
+        if found is None:
+            raise RoverDeviceNotFound(failures)
+        port, device, version = found
+        async with device:
+            yield device, version
+        return
+
+    if cache_path is None:
+        cache_path = default_port_cache_path()
+    cache = _load_port_cache(cache_path) if use_cache else {}
+    # listing ports opens none of them, so look up where each cached device is now
+    all_comports = comports()
+    port_keys = {c.device: _port_key(c) for c in all_comports}
+    present_keys = set(port_keys.values())
+    stale_keys = [k for k in cache if k not in present_keys]
+    cached_ports = [port for port, key in port_keys.items() if key in cache]
+    found = await _probe_ports(cached_ports, failures) if cached_ports else None
+    if found is None:
+        ports = [c.device for c in all_comports if c.manufacturer == "FTDI"]
+        found = await _probe_ports([p for p in ports if p not in cached_ports], failures)
+    if found is None:
+        if use_cache and stale_keys:
+            _update_port_cache(cache_path, forget=stale_keys)
+        raise RoverDeviceNotFound(failures)
+    port, device, version = found
+
+    async with device:
+        if use_cache:
+            _update_port_cache(cache_path, (port_keys[port], port, version), stale_keys)
+        yield device, version
@@ -0,0 +1,103 @@
+"""Drive many rovers attached to the same host from one trio loop.
+
+async with open_rover_fleet() as fleet:
+    fleet.broadcast_speeds(0.2, 0.2, 0)
+    data = await fleet.gather_data([14, 16])
+"""
+
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+import trio
+from async_generator import asynccontextmanager
+
+from .find_device import get_ftdi_device_paths
+from .rover import DataItems, open_rover, Rover
+from .rover_data import RoverFirmwareVersion
+from .util import RoverDeviceNotFound
+
+
+class RoverFleet:
+    def __init__(self):
+        """The rovers opened by open_rover_fleet, keyed by serial port"""
+        # port -> rover, for each rover currently open
+        self.rovers = {}  # type: Dict[str, Rover]
+        # port -> firmware version, for each rover currently open
+        self.versions = {}  # type: Dict[str, RoverFirmwareVersion]
+        # port -> why it is not (or no longer) open, for each port that was tried
+        self.errors = {}  # type: Dict[str, Exception]
+
+    def __len__(self):
+        return len(self.rovers)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.rovers)
+
+    def __getitem__(self, port: str) -> Rover:
+        return self.rovers[port]
+
+    def with_version(self, version: Union[str, RoverFirmwareVersion]) -> Dict[str, Rover]:
+        """The rovers running the given firmware version, keyed by port"""
+        if isinstance(version, str):
+            version = RoverFirmwareVersion.parse(version)
+        return {port: self.rovers[port] for port, v in self.versions.items() if v == version}
+
+    def broadcast_speeds(self, left, right, flipper):
+        """Set the motor speeds of every rover. See Rover.set_motor_speeds"""
+        for rover in self.rovers.values():
+            rover.set_motor_speeds(left, right, flipper)
+
+    async def gather_data(
+        self, indices: Iterable[int], timeout: float = 1, max_age: Optional[float] = None
+    ) -> Dict[str, DataItems]:
+        """Get the given data elements from every rover at once. See Rover.get_data_items"""
+        indices = list(indices)
+        results = {}
+
+        async def get_one(port, rover):
+            results[port] = await rover.get_data_items(indices, timeout, max_age)
+
+        async with trio.open_nursery() as nursery:
+            for port, rover in self.rovers.items():
+                nursery.start_soon(get_one, port, rover)
+        return results
+
+    async def _run_rover(self, port: str, task_status=trio.TASK_STATUS_IGNORED):
+        """Open the rover on the given port and keep it open until cancelled.
+        If it can't be opened or fails later, record why instead of raising."""
+        started = False
+        try:
+            async with open_rover(port) as rover:
+                self.versions[port] = rover.firmware_version
+                self.rovers[port] = rover
+                started = True
+                task_status.started()
+                await trio.sleep_forever()
+        except Exception as e:
+            self.errors[port] = e
+        finally:
+            self.rovers.pop(port, None)
+            self.versions.pop(port, None)
+            if not started:
+                task_status.started()
+
+
+@asynccontextmanager
+async def open_rover_fleet(*ports_to_try: str):
+    """Open every rover attached to this host.
+    All ports are probed at once, so this takes about one probe timeout however many there are.
+    A rover that stops working is removed from the fleet; the others carry on.
+    :param ports_to_try: if provided, the devices to attempt to open. Otherwise, all FTDI devices
+    :return: A RoverFleet. If no rovers respond, raises RoverDeviceNotFound
+    """
+    fleet = RoverFleet()
+    ports = ports_to_try or get_ftdi_device_paths()
+    async with trio.open_nursery() as nursery:
+        async with trio.open_nursery() as probe_nursery:
+            for port in ports:
+                probe_nursery.start_soon(nursery.start, fleet._run_rover, port)
+        if not fleet.rovers:
+            raise RoverDeviceNotFound(list(fleet.errors.items()))
+        try:
+            yield fleet
+        finally:
+            nursery.cancel_scope.cancel()
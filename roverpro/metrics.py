@@ -0,0 +1,115 @@
+"""Counters and histograms describing how well the driver is talking to the rover.
+See Rover.metrics() for a snapshot of them all."""
+
+import bisect
+import math
+from typing import Any, Dict, Optional, Sequence
+
+# upper bounds (seconds) of the buckets of request round trip time histograms
+RTT_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+# each byte on the serial line takes a start bit, 8 data bits, and a stop bit
+BITS_PER_BYTE = 10
+
+
+class Histogram:
+    """Counts of observed values in fixed buckets"""
+
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds: Sequence[float]):
+        # upper bound of each bucket. Values above the last bound go in one more bucket.
+        self.bounds = tuple(sorted(bounds))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = -math.inf
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.max < value:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """The upper bound of the bucket holding the q-th quantile (0-1) of observed values"""
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if rank <= seen:
+                return bound
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else math.nan,
+            "max": self.max if self.count else math.nan,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": list(zip(self.bounds + (math.inf,), self.counts)),
+        }
+
+
+class RequestMetrics:
+    """Round trip times and failures of GET_DATA requests"""
+
+    def __init__(self, rtt_buckets: Sequence[float] = RTT_BUCKETS):
+        self.rtt_buckets = rtt_buckets
+        # data element index -> round trip times of its requests
+        self.rtt = {}  # type: Dict[int, Histogram]
+        # data element index -> when it was last requested, if not yet answered
+        self._sent_at = {}  # type: Dict[int, float]
+        self.n_requests = 0
+        self.n_responses = 0
+        # requests which were given up on and sent again
+        self.n_lost = 0
+        # requests which were never answered
+        self.n_timeouts = 0
+
+    def on_request(self, index: int, now: float):
+        self.n_requests += 1
+        self._sent_at[index] = now
+
+    def on_response(self, index: int, now: float):
+        """Record the time since the data element was last requested, if it was"""
+        self.n_responses += 1
+        sent_at = self._sent_at.pop(index, None)
+        if sent_at is None:
+            return
+        histogram = self.rtt.get(index)
+        if histogram is None:
+            histogram = self.rtt[index] = Histogram(self.rtt_buckets)
+        histogram.observe(now - sent_at)
+
+    def on_lost(self, index: int):
+        self.n_lost += 1
+        self._sent_at.pop(index, None)
+
+    def on_timeout(self, index: int):
+        self.n_timeouts += 1
+        self._sent_at.pop(index, None)
+
+    def rtt_snapshot(self, index: Optional[int] = None) -> Dict[str, Any]:
+        """Snapshot of the round trip time histogram of one data element, or of all combined"""
+        if index is not None:
+            return self.rtt.get(index, Histogram(self.rtt_buckets)).snapshot()
+        combined = Histogram(self.rtt_buckets)
+        for histogram in self.rtt.values():
+            combined.counts = [a + b for a, b in zip(combined.counts, histogram.counts)]
+            combined.count += histogram.count
+            combined.total += histogram.total
+            combined.max = max(combined.max, histogram.max)
+        return combined.snapshot()
+
+
+def utilization_percent(n_bytes: int, baudrate: float, seconds: float) -> float:
+    """How much of a serial line's capacity in one direction n_bytes took up"""
+    if seconds <= 0:
+        return 0.0
+    return 100 * n_bytes * BITS_PER_BYTE / (baudrate * seconds)
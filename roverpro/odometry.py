@@ -0,0 +1,196 @@
+"""Track where the rover is from its wheel encoder counts.
+
+geometry = WheelGeometry(meters_per_count=0.0005, track_width=0.33, counts_per_second=2000)
+async with open_rover() as rover:
+    async with open_odometry(rover, geometry) as odometry:
+        rover.set_motor_speeds(0.5, 0.5, 0)
+        await trio.sleep(1)
+        print(odometry.pose)
+
+The encoder counts reported by the rover are 16 bits and wrap around. Two readings can only be
+told apart if the wheel turned less than half that range between them, so the counts are polled
+faster the faster the motors are driven.
+"""
+
+import math
+from typing import Dict, NamedTuple, Optional, Set, Tuple
+
+import trio
+from async_generator import asynccontextmanager
+
+from .rover import Rover
+from .rover_data import fix_encoder_delta
+
+# data element indices of the left and right motor encoder counts
+LEFT_ENCODER_COUNT = 14
+RIGHT_ENCODER_COUNT = 16
+
+# encoder counts are unambiguous as long as they change by less than this between readings
+ENCODER_HALF_RANGE = 2 ** 15
+
+
+class WheelGeometry(NamedTuple):
+    """How encoder counts translate into motion of a differential-drive rover"""
+
+    # distance a wheel or track moves per encoder count
+    meters_per_count: float
+    # distance between the left and right wheels or tracks
+    track_width: float
+    # encoder counts per second when a motor is driven at full effort
+    counts_per_second: float
+
+
+class Pose(NamedTuple):
+    """Where the rover is relative to where odometry started"""
+
+    # meters forward of the starting position
+    x: float = 0.0
+    # meters left of the starting position
+    y: float = 0.0
+    # radians counterclockwise from the starting heading, between -pi and pi
+    heading: float = 0.0
+    # trio.current_time() of the encoder readings this pose was computed from
+    timestamp: Optional[float] = None
+
+
+class Odometry:
+    def __init__(
+        self,
+        geometry: WheelGeometry,
+        min_rate: float = 10,
+        max_rate: float = 100,
+        safety_factor: float = 4,
+    ):
+        """Dead reckoning from encoder counts. Feed it readings with update(), or use
+        open_odometry to poll a rover.
+        :param min_rate: fewest readings per second to request of each encoder
+        :param max_rate: most readings per second to request of each encoder
+        :param safety_factor: request readings often enough that the motors turn at most
+            1/safety_factor of the unambiguous range between them
+        """
+        if not 0 < min_rate <= max_rate:
+            raise ValueError("rates must be positive, and min_rate at most max_rate")
+        if safety_factor < 1:
+            raise ValueError("safety_factor must be at least 1")
+        self.geometry = geometry
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.safety_factor = safety_factor
+        # the latest pose. Replaced, never modified, so it can be read at any time.
+        self.pose = Pose()
+        # total encoder counts since odometry started. Unlike the rover's, these never wrap.
+        self.left_count = 0
+        self.right_count = 0
+        # encoder counts per second measured between the last two readings of each side
+        self.left_speed = 0.0
+        self.right_speed = 0.0
+        # number of encoder count readings received
+        self.n_readings = 0
+        # side -> the last (raw 16-bit count, time received) of that side
+        self._last_reading = {}  # type: Dict[int, Tuple[int, float]]
+        # sides with a reading since the pose was last updated
+        self._fresh = set()  # type: Set[int]
+        # counts when the pose was last updated
+        self._integrated = (0, 0)
+
+    def update(self, index: int, raw_count: int, timestamp: float):
+        """Take in an encoder count reading (data element 14 or 16) received at timestamp.
+        The pose is updated once both sides have new readings, so both cover the same motion."""
+        if index not in (LEFT_ENCODER_COUNT, RIGHT_ENCODER_COUNT):
+            raise ValueError(f"Data element {index} is not an encoder count")
+        self.n_readings += 1
+        last = self._last_reading.get(index)
+        self._last_reading[index] = (raw_count, timestamp)
+        if last is None:
+            # the first reading is the starting point
+            return
+        last_count, last_timestamp = last
+        delta = fix_encoder_delta(raw_count - last_count)
+        dt = timestamp - last_timestamp
+        speed = delta / dt if dt > 0 else 0.0
+        if index == LEFT_ENCODER_COUNT:
+            self.left_count += delta
+            self.left_speed = speed
+        else:
+            self.right_count += delta
+            self.right_speed = speed
+
+        self._fresh.add(index)
+        if len(self._fresh) == 2:
+            self._fresh.clear()
+            left_integrated, right_integrated = self._integrated
+            self._integrate(
+                self.left_count - left_integrated, self.right_count - right_integrated, timestamp
+            )
+            self._integrated = (self.left_count, self.right_count)
+
+    def _integrate(self, left_delta: int, right_delta: int, timestamp: float):
+        """Move the pose by the given encoder counts, assuming the rover drove along an arc"""
+        meters_per_count = self.geometry.meters_per_count
+        left = left_delta * meters_per_count
+        right = right_delta * meters_per_count
+        distance = (left + right) / 2
+        turn = (right - left) / self.geometry.track_width
+        x, y, heading, _ = self.pose
+        direction = heading + turn / 2
+        heading += turn
+        self.pose = Pose(
+            x + distance * math.cos(direction),
+            y + distance * math.sin(direction),
+            math.atan2(math.sin(heading), math.cos(heading)),
+            timestamp,
+        )
+
+    def reset(self, pose: Pose = Pose()):
+        """Make the current position the given pose. Encoder counts carry on from where they are"""
+        self.pose = pose._replace(timestamp=self.pose.timestamp)
+
+    def polling_rate(self, motor_efforts: Tuple[float, ...]) -> float:
+        """How many readings per second of each encoder keep them unambiguous, given the
+        commanded motor efforts and the speed the wheels were last measured turning at"""
+        commanded = (
+            max(abs(effort) for effort in motor_efforts[:2]) * self.geometry.counts_per_second
+        )
+        measured = max(abs(self.left_speed), abs(self.right_speed))
+        rate = max(commanded, measured) * self.safety_factor / ENCODER_HALF_RANGE
+        return min(max(rate, self.min_rate), self.max_rate)
+
+    async def _run(self, rover: Rover, task_status=trio.TASK_STATUS_IGNORED):
+        """Poll the rover's encoders and keep the pose up to date until cancelled"""
+        rate = self.polling_rate(rover.motor_speeds)
+        subscription = rover.subscribe({LEFT_ENCODER_COUNT: rate, RIGHT_ENCODER_COUNT: rate})
+        task_status.started()
+        try:
+            while True:
+                sample = await subscription.receive()
+                self.update(sample.index, sample.value, sample.timestamp)
+                new_rate = self.polling_rate(rover.motor_speeds)
+                if rate < new_rate or new_rate < rate / 2:
+                    # subscribe at the new rate before unsubscribing, so polling never stops
+                    if rate < new_rate:
+                        # leave headroom so a slowly rising speed doesn't resubscribe every time
+                        new_rate = min(new_rate * 1.25, self.max_rate)
+                    old_subscription = subscription
+                    subscription = rover.subscribe(
+                        {LEFT_ENCODER_COUNT: new_rate, RIGHT_ENCODER_COUNT: new_rate}
+                    )
+                    old_subscription.close()
+                    rate = new_rate
+        finally:
+            subscription.close()
+
+
+@asynccontextmanager
+async def open_odometry(rover: Rover, geometry: WheelGeometry, **kwargs):
+    """Track the rover's pose for the duration of the context.
+    Requires firmware 1.4 or later, which reports encoder counts.
+    :param kwargs: passed to Odometry
+    :return: An Odometry. Its `pose` is always the latest, without waiting on the rover.
+    """
+    odometry = Odometry(geometry, **kwargs)
+    async with trio.open_nursery() as nursery:
+        await nursery.start(odometry._run, rover)
+        try:
+            yield odometry
+        finally:
+            nursery.cancel_scope.cancel()
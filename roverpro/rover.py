@@ -1,23 +1,161 @@
-from typing import Any, Dict, Iterable, Optional
+import array
+import collections
+import math
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import trio
 from async_generator import asynccontextmanager
 
-from roverpro.find_device import open_rover_device
-from roverpro.rover_data import ROVER_DATA_ELEMENTS
-from .rover_protocol import CommandVerb, RoverProtocol
+from roverpro.find_device import DEFAULT_SERIAL_KWARGS, open_rover_device_with_version
+from roverpro.rover_data import (
+    ROVER_DATA_DECODERS,
+    ROVER_DATA_ELEMENTS,
+    RoverFirmwareVersion,
+    supported_elements,
+    SupportedElements,
+)
+from .metrics import RequestMetrics, utilization_percent
+from .rover_protocol import CommandQueue, CommandVerb, RoverProtocol
+from .scheduler import link_capacity, PollScheduler
 from .serial_trio import SerialTrio
-from .util import RoverException
+from .subscription import DataSample, Subscription
+from .util import RoverException, UnsupportedDataElement
 
 
 @asynccontextmanager
-async def open_rover(path_to_serial: Optional[str] = None):
+async def open_rover(path_to_serial: Optional[str] = None, capture=None, tracer=None):
+    """Connect to a rover and run the tasks that talk to it for the duration of the context.
+    :param capture: if given, a roverpro.capture.FrameCapture to record all frames into
+    :param tracer: if given, a roverpro.tracing.Tracer to record the life of each request into"""
     args = [] if path_to_serial is None else [path_to_serial]
 
-    async with open_rover_device(*args) as device:
-        rover = Rover()
-        await rover.set_device(device)
-        yield rover
+    async with open_rover_device_with_version(*args) as (device, version):
+        async with trio.open_nursery() as nursery:
+            rover = Rover()
+            await rover.set_device(device, capture, tracer)
+            instrument = None
+            if tracer is not None:
+                # the instrument sees every task in the run, including other rovers' readers
+                instrument = tracer.instrument(lambda task: task is rover._read_task)
+                trio.lowlevel.add_instrument(instrument)
+            try:
+                await nursery.start(rover._read_loop)
+                await nursery.start(rover._write_loop)
+                await nursery.start(rover._poll_loop)
+                await nursery.start(rover._keepalive_loop)
+                # the rover already told us its version when its device was found
+                await rover._detect_firmware_version(version)
+                yield rover
+            finally:
+                nursery.cancel_scope.cancel()
+                if instrument is not None:
+                    trio.lowlevel.remove_instrument(instrument)
+
+
+class _PendingResponse:
+    """A request for a data element which has not yet been answered"""
+
+    __slots__ = ("index", "event", "value", "error", "timestamp", "channel")
+
+    def __init__(self, index, channel=None):
+        self.index = index
+        self.event = trio.Event()
+        self.value = None
+        self.error = None  # type: Optional[Exception]
+        # trio.current_time() when the response arrived
+        self.timestamp = None  # type: Optional[float]
+        # if given, this response is also sent on this channel when it arrives
+        self.channel = channel
+
+
+class DataItems(dict):
+    """Values of several data elements, keyed by index.
+    Elements which could not be read have the value None and the reason in `errors`."""
+
+    def __init__(self, indices: Iterable[int]):
+        super().__init__(dict.fromkeys(indices))
+        self.errors = {}  # type: Dict[int, Exception]
+        # data element index -> trio.current_time() when its value was received
+        self.timestamps = {}  # type: Dict[int, float]
+
+    def _set_value(self, index: int, value, timestamp: float):
+        self[index] = value
+        self.timestamps[index] = timestamp
+
+
+class DataBatch:
+    """Values of a fixed set of data elements, like DataItems, but kept in preallocated arrays
+    so the same batch can be filled by Rover.get_data_batch again and again without allocating
+    a new result each time. Read values with batch[index]; to_dict() copies them out."""
+
+    __slots__ = ("indices", "errors", "_positions", "_values", "_timestamps", "_no_timestamps")
+
+    def __init__(self, indices: Iterable[int]):
+        self.indices = tuple(sorted(set(indices)))
+        # data element index -> why it could not be read, for elements which could not be
+        self.errors = {}  # type: Dict[int, Exception]
+        # data element index -> where its value and timestamp are kept
+        self._positions = {index: i for i, index in enumerate(self.indices)}
+        self._values = [None] * len(self.indices)  # type: List[Any]
+        self._timestamps = array.array("d", [math.nan]) * len(self.indices)
+        # copied over _timestamps to clear it
+        self._no_timestamps = array.array("d", self._timestamps)
+
+    def clear(self):
+        """Forget all values, ready to be filled again"""
+        values = self._values
+        for i in range(len(values)):
+            values[i] = None
+        self._timestamps[:] = self._no_timestamps
+        self.errors.clear()
+
+    def _set_value(self, index: int, value, timestamp: float):
+        position = self._positions[index]
+        self._values[position] = value
+        self._timestamps[position] = timestamp
+
+    def __getitem__(self, index: int) -> Any:
+        return self._values[self._positions[index]]
+
+    def __contains__(self, index) -> bool:
+        return index in self._positions
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def timestamp(self, index: int) -> float:
+        """trio.current_time() when the element's value was received, or NaN if it wasn't"""
+        return self._timestamps[self._positions[index]]
+
+    def items(self) -> Iterator[Tuple[int, Any]]:
+        return zip(self.indices, self._values)
+
+    def to_dict(self) -> DataItems:
+        """A copy of the values, timestamps, and errors as DataItems"""
+        result = DataItems(self.indices)
+        for index, value, timestamp in zip(self.indices, self._values, self._timestamps):
+            if not math.isnan(timestamp):
+                result._set_value(index, value, timestamp)
+        result.errors.update(self.errors)
+        return result
+
+
+class Snapshot(DataItems):
+    """Values of many data elements requested together, as returned by Rover.snapshot"""
+
+    def __init__(self, indices: Iterable[int], firmware_version=None):
+        super().__init__(indices)
+        self.firmware_version = firmware_version
+
+    @property
+    def skew(self) -> float:
+        """Seconds between the oldest and newest value received"""
+        if not self.timestamps:
+            return 0.0
+        return max(self.timestamps.values()) - min(self.timestamps.values())
 
 
 class Rover:
@@ -27,18 +165,216 @@ class Rover:
 
     _rover_protocol = None
     _device = None
+    _tracer = None
+    # the connected rover's firmware version and the data elements it responds to, once known
+    firmware_version = None  # type: Optional[RoverFirmwareVersion]
+    _supported = None  # type: Optional[SupportedElements]
+
+    # While the motors are commanded to move, a frame carrying the latest motor efforts is sent at
+    # least this often (seconds). Any command counts, so this only adds frames when idle.
+    keepalive_interval = 0.1
+
+    # Most bytes to leave waiting in the device's outgoing buffer (20 frames, about 25 ms at
+    # 57600 baud). Beyond this, commands wait in a CommandQueue, where stale ones are replaced
+    # by newer ones, so the rover acts on fresh commands instead of a backlog of old ones.
+    max_outbound_backlog = 140
+
+    # bounds on the number of GET_DATA requests get_data_items keeps in flight
+    _min_request_window = 1
+    _max_request_window = 32
+    # bounds on how long get_data_items waits for a response before requesting it again
+    _min_retry_interval = 0.02
+    _max_retry_interval = 0.5
 
     def __init__(self):
         self._motor_left = 0
         self._motor_right = 0
         self._motor_flipper = 0
-        self._rover_data_to_memory_channel = {
-            i: trio.open_memory_channel(0) for i in ROVER_DATA_ELEMENTS.keys()
+        # time the last frame was sent and the motor efforts it carried
+        self._last_sent_time = -math.inf
+        # time a keepalive NOP was last queued behind a backlog. It carries the latest motor
+        # efforts when it is written, so it counts as sent for keepalive purposes.
+        self._keepalive_queued_time = -math.inf
+        self._last_sent_motors = (0, 0, 0)
+        self._motors_changed = trio.lowlevel.ParkingLot()
+        # commands waiting for the device's outgoing backlog to drain
+        self._outbound = CommandQueue()
+        self._outbound_queued = trio.lowlevel.ParkingLot()
+        # for each data element, the requests awaiting a response, oldest first
+        self._pending_responses = {i: collections.deque() for i in ROVER_DATA_ELEMENTS.keys()}
+        # for each data element, the subscriptions receiving its values
+        self._subscriptions = {i: [] for i in ROVER_DATA_ELEMENTS.keys()}
+        self._subscriptions_changed = trio.lowlevel.ParkingLot()
+        # decides how often to poll subscribed data elements when the link can't keep up
+        self.poll_scheduler = PollScheduler(on_change=self._subscriptions_changed.unpark_all)
+        # data element index -> (most recently received value, time received)
+        self._cache = {}  # type: Dict[int, Tuple[Any, float]]
+        # for each data element, when the cache of it was last invalidated, and when each
+        # request for it still awaiting a response was sent, oldest first. Responses are matched
+        # to requests in order, so those to requests from before the invalidation aren't cached.
+        self._cache_invalidated_at = {i: -math.inf for i in ROVER_DATA_ELEMENTS.keys()}
+        self._request_sent_at = {
+            i: collections.deque(maxlen=self._max_request_window)
+            for i in ROVER_DATA_ELEMENTS.keys()
         }
+        # number of requests get_data_items may have in flight. Grows as responses arrive and
+        # shrinks when they are lost.
+        self._request_window = 4.0
+        # smoothed round trip time of a GET_DATA request
+        self._smoothed_rtt = 0.05
+        self._request_metrics = RequestMetrics()
+        self._device_set_time = None  # type: Optional[float]
+        # the task running _read_loop, once it has started
+        self._read_task = None  # type: Optional[trio.lowlevel.Task]
 
-    async def set_device(self, device: SerialTrio):
+    async def set_device(self, device: SerialTrio, capture=None, tracer=None):
         self._device = device
-        self._rover_protocol = RoverProtocol(device)
+        self._rover_protocol = RoverProtocol(device, capture)
+        self._tracer = tracer
+        device.tracer = tracer
+        self._device_set_time = trio.current_time()
+        baudrate = device.serial_kwargs.get("baudrate", DEFAULT_SERIAL_KWARGS["baudrate"])
+        self.poll_scheduler.capacity = link_capacity(baudrate)
+
+    async def _detect_firmware_version(self, version: Optional[RoverFirmwareVersion] = None):
+        """Ask the rover for its firmware version unless it is given, after which requests for
+        data elements it doesn't respond to fail immediately"""
+        if version is None:
+            version = await self.get_data(40)
+        else:
+            self._cache[40] = (version, trio.current_time())
+        self.firmware_version = version
+        self._supported = supported_elements(version)
+
+    def _check_supported(self, index):
+        """Raise if the rover won't respond to requests for the data element"""
+        if index not in ROVER_DATA_ELEMENTS:
+            raise RoverException(f"No such data element {index}")
+        if self._supported is not None:
+            self._supported.check(index)
+
+    async def _read_loop(self, task_status=trio.TASK_STATUS_IGNORED):
+        """Receive all incoming data and hand each value to all requests waiting for it and to
+        all subscribers. Exactly one of these should run for each device."""
+        tracer = self._tracer
+        self._read_task = trio.lowlevel.current_task()
+        task_status.started()
+        while True:
+            frames = await self._rover_protocol.read_frames()
+            decoders = ROVER_DATA_DECODERS if self._supported is None else self._supported.decoders
+            now = trio.current_time()
+            request_metrics = self._request_metrics
+            for index, payload in frames:
+                request_metrics.on_response(index, now)
+                sent_at = self._request_sent_at[index]
+                sent_at = sent_at.popleft() if sent_at else -math.inf
+                pending = self._pending_responses[index]
+                subscriptions = self._subscriptions[index]
+                if not pending and not subscriptions:
+                    continue
+
+                value = error = None
+                try:
+                    value = decoders[index](payload)
+                except ValueError as e:
+                    error = RoverException(
+                        f"Could not decode data element {index} from {payload.hex()}"
+                    )
+                    error.__cause__ = e
+                if tracer is not None:
+                    tracer.on_response(index, now, trio.current_time())
+
+                # Duplicate requests may have been collapsed into one, so a value answers them all
+                for response in pending:
+                    response.value = value
+                    response.error = error
+                    response.timestamp = now
+                    response.event.set()
+                    if response.channel is not None:
+                        response.channel.send_nowait(response)
+                pending.clear()
+                if error is not None:
+                    continue
+                if self._cache_invalidated_at[index] < sent_at:
+                    self._cache[index] = (value, now)
+                if subscriptions:
+                    sample = DataSample(index, value, now)
+                    for subscription in subscriptions:
+                        subscription._push(sample)
+                    self.poll_scheduler.on_sample(index, now)
+
+    async def _poll_loop(self, task_status=trio.TASK_STATUS_IGNORED):
+        """Send GET_DATA requests for subscribed data elements, each at the fastest rate any
+        subscriber asked for, or slower if poll_scheduler says the link can't keep up"""
+        next_due = {}  # type: Dict[int, float]
+        task_status.started()
+        while True:
+            rates = self.poll_scheduler.plan(self._subscribed_rates())
+            for index in list(next_due):
+                if index not in rates:
+                    del next_due[index]
+            now = trio.current_time()
+            for index in rates:
+                next_due.setdefault(index, now)
+
+            if not next_due:
+                await self._subscriptions_changed.park()
+                continue
+
+            wake_at = min(next_due.values())
+            if now < wake_at:
+                with trio.move_on_at(wake_at):
+                    # subscriptions changed. Recompute the schedule
+                    await self._subscriptions_changed.park()
+                    continue
+                now = trio.current_time()
+
+            for index, due in next_due.items():
+                if due <= now:
+                    try:
+                        self._send_command(CommandVerb.GET_DATA, index)
+                    except trio.WouldBlock:
+                        # the link is overloaded. Skip this sample rather than add to the backlog.
+                        pass
+                    # if we fell behind, don't try to catch up with a burst of requests
+                    next_due[index] = max(due + 1 / rates[index], now)
+
+    def _subscribed_rates(self) -> Dict[int, float]:
+        return {
+            index: max(s.rates[index] for s in subscriptions)
+            for index, subscriptions in self._subscriptions.items()
+            if subscriptions
+        }
+
+    def subscribe(self, rates: Dict[int, float], buffer_size: int = 100) -> Subscription:
+        """Poll the given data elements in the background and stream their values.
+        :param rates: data element index -> how many samples per second to request
+        :param buffer_size: how many samples to keep if the consumer falls behind
+        :return: An async iterator of DataSample. It also receives values requested by other
+            subscribers or by get_data. Close it (or use it as a context manager) to stop polling.
+        """
+        for index in rates:
+            self._check_supported(index)
+        subscription = Subscription(rates, buffer_size, self._unsubscribe)
+        for index in subscription.rates:
+            self._subscriptions[index].append(subscription)
+        self._subscriptions_changed.unpark_all()
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        for index in subscription.rates:
+            self._subscriptions[index].remove(subscription)
+        self._subscriptions_changed.unpark_all()
+
+    def _expect_response(self, index, channel=None) -> _PendingResponse:
+        self._check_supported(index)
+        response = _PendingResponse(index, channel)
+        self._pending_responses[index].append(response)
+        return response
+
+    def _abandon_response(self, response: _PendingResponse):
+        if not response.event.is_set():
+            self._pending_responses[response.index].remove(response)
 
     def set_motor_speeds(self, left, right, flipper):
         assert -1 <= left <= 1
@@ -47,11 +383,73 @@ class Rover:
         self._motor_left = left
         self._motor_right = right
         self._motor_flipper = flipper
+        self._motors_changed.unpark_all()
+
+    @property
+    def motor_speeds(self) -> Tuple[float, float, float]:
+        """The left, right, and flipper motor efforts last set with set_motor_speeds"""
+        return self._motor_left, self._motor_right, self._motor_flipper
+
+    async def _keepalive_loop(self, task_status=trio.TASK_STATUS_IGNORED):
+        """Make sure the latest motor efforts reach the rover at least every keepalive_interval.
+        Every outgoing frame carries them, so a NOP is only sent if no other frame went out."""
+        task_status.started()
+        while True:
+            motors = (self._motor_left, self._motor_right, self._motor_flipper)
+            if motors == self._last_sent_motors and not any(motors):
+                # the rover already knows to stay still
+                await self._motors_changed.park()
+                continue
+            due = max(self._last_sent_time, self._keepalive_queued_time) + self.keepalive_interval
+            if trio.current_time() < due:
+                await trio.sleep_until(due)
+            else:
+                self.send_speed()
+                if self._outbound:
+                    self._keepalive_queued_time = trio.current_time()
+
+    async def _write_loop(self, task_status=trio.TASK_STATUS_IGNORED):
+        """Send queued commands as the device's outgoing backlog drains"""
+        task_status.started()
+        while True:
+            if not self._outbound:
+                await self._outbound_queued.park()
+                continue
+            await self._device.flush(self.max_outbound_backlog)
+            while self._outbound and self._device.out_waiting <= self.max_outbound_backlog:
+                self._write_command(*self._outbound.get_nowait())
 
     def _send_command(self, cmd, arg):
-        self._rover_protocol.write_nowait(
-            self._motor_left, self._motor_right, self._motor_flipper, cmd, arg
-        )
+        """Send a command, or queue it if the device is backlogged.
+        Raises trio.WouldBlock if it is a GET_DATA request and the queue is full"""
+        if cmd in (CommandVerb.RESTART, CommandVerb.RELOAD_SETTINGS):
+            self.invalidate_cache()
+        if self._tracer is not None and cmd == CommandVerb.GET_DATA:
+            self._tracer.on_request_queued(arg, trio.current_time())
+        if self._outbound or self.max_outbound_backlog < self._device.out_waiting:
+            self._outbound.put_nowait(cmd, arg)
+            self._outbound_queued.unpark_all()
+        else:
+            self._write_command(cmd, arg)
+
+    async def _send_command_when_ready(self, cmd, arg):
+        """Send a command, waiting for room in the queue if the device is backlogged"""
+        while True:
+            try:
+                return self._send_command(cmd, arg)
+            except trio.WouldBlock:
+                await self._outbound.wait_space_available()
+
+    def _write_command(self, cmd, arg):
+        motors = (self._motor_left, self._motor_right, self._motor_flipper)
+        self._rover_protocol.write_nowait(*motors, cmd, arg)
+        self._last_sent_time = trio.current_time()
+        self._last_sent_motors = motors
+        if cmd == CommandVerb.GET_DATA:
+            self._request_sent_at[arg].append(self._last_sent_time)
+            self._request_metrics.on_request(arg, self._last_sent_time)
+            if self._tracer is not None:
+                self._tracer.on_request_written(arg, self._last_sent_time)
 
     def send_speed(self):
         self._send_command(CommandVerb.NOP, 0)
@@ -66,38 +464,242 @@ class Rover:
     def flipper_calibrate(self):
         self._send_command(CommandVerb.FLIPPER_CALIBRATE, int(CommandVerb.FLIPPER_CALIBRATE))
 
-    async def get_data(self, index) -> Any:
-        """Get the next value for the given data index.
-        The type of the returned value depends on the index passed."""
-        self._send_command(CommandVerb.GET_DATA, index)
-        with trio.fail_after(1):
-            k, data = await self._rover_protocol.read_one()
-            if k != index:
-                raise RoverException(
-                    f"Received unexpected data. Expected {index}, received {k}:{data}"
-                )
+    def metrics(self) -> Dict[str, Any]:
+        """A snapshot of counters and histograms describing the link to the rover, as plain data.
+        Round trip times (seconds) are per data element and combined under "all". Polling rates
+        (per second) are per subscribed data element. Link utilization is averaged over the whole
+        time since the device was set, not a recent window."""
+        device = self._device
+        protocol = self._rover_protocol
+        requests = self._request_metrics
+        elapsed = trio.current_time() - self._device_set_time
+        baudrate = device.serial_kwargs.get("baudrate", DEFAULT_SERIAL_KWARGS["baudrate"])
+        return {
+            "elapsed_s": elapsed,
+            "link": {
+                "baudrate": baudrate,
+                "bytes_received": device.n_bytes_read,
+                "bytes_sent": device.n_bytes_written,
+                "frames_received": protocol.n_frames_received,
+                "frames_sent": protocol.n_frames_sent,
+                "write_syscalls": device.n_write_syscalls,
+                "inbound_utilization_percent": utilization_percent(
+                    device.n_bytes_read, baudrate, elapsed
+                ),
+                "outbound_utilization_percent": utilization_percent(
+                    device.n_bytes_written, baudrate, elapsed
+                ),
+                "max_read_bytes": device.max_bytes_read,
+                "outbound_high_water_bytes": device.max_out_waiting,
+            },
+            "decoder": {
+                "checksum_failures": protocol.decoder.n_bad_frames,
+                "resync_bytes_skipped": protocol.decoder.n_skipped_bytes,
+            },
+            "requests": {
+                "sent": requests.n_requests,
+                "responses": requests.n_responses,
+                "lost": requests.n_lost,
+                "timeouts": requests.n_timeouts,
+                "queue_high_water": self._outbound.max_len,
+                "collapsed": self._outbound.n_collapsed,
+            },
+            "polling": self.poll_scheduler.report(),
+            "rtt_s": dict(
+                {index: requests.rtt_snapshot(index) for index in sorted(requests.rtt)},
+                all=requests.rtt_snapshot(),
+            ),
+        }
 
-        return data
+    def invalidate_cache(self, index: Optional[int] = None):
+        """Forget previously received values of the given data element, or of all data elements.
+        Responses to requests already sent won't be remembered either."""
+        now = trio.current_time()
+        if index is None:
+            self._cache.clear()
+            for i in self._cache_invalidated_at:
+                self._cache_invalidated_at[i] = now
+        else:
+            self._cache.pop(index, None)
+            self._cache_invalidated_at[index] = now
 
-    async def get_data_items(self, indices: Iterable[int]) -> Dict[int, Any]:
-        indices = sorted(set(indices))
-        result = dict.fromkeys(indices)
+    def _get_cached(self, index, max_age: Optional[float]) -> Tuple[bool, Any, float]:
+        """Return whether we have a fresh enough value of the data element, that value, and
+        when it was received"""
+        if max_age is None:
+            element = ROVER_DATA_ELEMENTS.get(index)
+            max_age = 0 if element is None else element.max_age
+        if max_age <= 0 or index not in self._cache:
+            return False, None, math.nan
+        value, received_at = self._cache[index]
+        return trio.current_time() - received_at <= max_age, value, received_at
 
-        for index in indices:
-            self._send_command(CommandVerb.GET_DATA, index)
-        for index in indices:
+    async def get_data(self, index, max_age: Optional[float] = None) -> Any:
+        """Get a value for the given data index.
+        The type of the returned value depends on the index passed.
+        :param max_age: Return a previously received value if it is at most this many seconds
+            old. By default, use the data element's max_age. Use 0 to always request a new value.
+        Raises UnsupportedDataElement at once if the rover's firmware doesn't respond to the index.
+        """
+        is_cached, value, _ = self._get_cached(index, max_age)
+        if is_cached:
+            return value
+        response = self._expect_response(index)
+        try:
             with trio.fail_after(1):
-                k, data = await self._rover_protocol.read_one()
-                if k != index:
-                    raise RoverException(
-                        "Received unexpected data. Expected {}, received {}:{}".format(
-                            index, k, data
-                        )
-                    )
-            result[k] = data
+                await self._send_command_when_ready(CommandVerb.GET_DATA, index)
+                await response.event.wait()
+            if self._tracer is not None:
+                self._tracer.on_delivered(index, trio.current_time())
+        except trio.TooSlowError:
+            self._request_metrics.on_timeout(index)
+            raise
+        finally:
+            self._abandon_response(response)
+        if response.error is not None:
+            raise response.error
+        return response.value
+
+    def _retry_interval(self):
+        return min(max(3 * self._smoothed_rtt, self._min_retry_interval), self._max_retry_interval)
+
+    def _on_request_answered(self, rtt: Optional[float]):
+        if rtt is not None:
+            self._smoothed_rtt += (rtt - self._smoothed_rtt) / 8
+        self._request_window = min(
+            self._request_window + 1 / self._request_window, self._max_request_window
+        )
+
+    def _on_requests_lost(self):
+        self._request_window = max(self._request_window / 2, self._min_request_window)
 
+    async def get_data_items(
+        self, indices: Iterable[int], timeout: float = 1, max_age: Optional[float] = None
+    ) -> DataItems:
+        """Get a value for each of the given data indices.
+        Requests are pipelined, keeping as many in flight as the link delivers without loss.
+        Requests that go unanswered are sent again until the timeout expires. Any element still
+        missing then is None in the result, with the reason in the result's `errors`. Elements
+        the rover's firmware doesn't respond to are not requested.
+        :param max_age: As in get_data"""
+        result = DataItems(sorted(set(indices)))
+        await self._fill_data_items(result, timeout, max_age)
         return result
 
+    async def get_data_batch(
+        self, batch: DataBatch, timeout: float = 1, max_age: Optional[float] = None
+    ) -> DataBatch:
+        """Like get_data_items, but fill the given batch (replacing what was in it) instead of
+        creating a new result. Reuse one batch for repeated reads of the same data elements.
+        :return: the batch"""
+        batch.clear()
+        await self._fill_data_items(batch, timeout, max_age)
+        return batch
+
+    async def snapshot(
+        self, elements: Optional[Iterable[int]] = None, timeout: float = 1
+    ) -> Snapshot:
+        """Get fresh values of many data elements at once, as close together in time as the
+        link allows. All requests are sent in one burst rather than paced by get_data_items'
+        adaptive window, unless some are lost.
+        :param elements: data element indices. By default, every element the rover's firmware
+            implements
+        :return: A Snapshot, with when each value was received in `timestamps` and the spread of
+            those times in `skew`. Elements that could not be read are in `errors`, as with
+            get_data_items.
+        """
+        if elements is None:
+            supported = (
+                ROVER_DATA_ELEMENTS if self._supported is None else self._supported.elements
+            )
+            elements = [i for i, e in supported.items() if not e.not_implemented]
+        result = Snapshot(sorted(set(elements)), self.firmware_version)
+        await self._fill_data_items(result, timeout, max_age=0, burst=len(result))
+        return result
+
+    async def _fill_data_items(
+        self,
+        result: Union[DataItems, "DataBatch"],
+        timeout: float,
+        max_age: Optional[float],
+        burst: int = 0,
+    ):
+        """Get a value for each data element in result, as described in get_data_items.
+        :param burst: allow this many requests in flight at once until one is lost"""
+        to_request = []
+        for index in result:
+            try:
+                self._check_supported(index)
+            except UnsupportedDataElement as e:
+                result.errors[index] = e
+                continue
+            is_cached, value, received_at = self._get_cached(index, max_age)
+            if is_cached:
+                result._set_value(index, value, received_at)
+            else:
+                to_request.append(index)
+        send_channel, receive_channel = trio.open_memory_channel(len(to_request))
+        responses = {index: self._expect_response(index, send_channel) for index in to_request}
+        unsent = collections.deque(to_request)
+        sent_at = {}  # type: Dict[int, float]
+        attempts = collections.Counter()
+        deadline = trio.current_time() + timeout
+        try:
+            while unsent or sent_at:
+                while unsent and len(sent_at) < max(int(self._request_window), burst):
+                    with trio.move_on_at(deadline) as cancel_scope:
+                        await self._send_command_when_ready(CommandVerb.GET_DATA, unsent[0])
+                    if cancel_scope.cancelled_caught:
+                        break
+                    index = unsent.popleft()
+                    sent_at[index] = trio.current_time()
+                    attempts[index] += 1
+                if not sent_at:
+                    # timed out waiting for room to send a request
+                    break
+
+                retry_at = min(sent_at.values()) + self._retry_interval()
+                with trio.move_on_at(min(retry_at, deadline)):
+                    response = await receive_channel.receive()
+                    if self._tracer is not None:
+                        self._tracer.on_delivered(response.index, trio.current_time())
+                    t_sent = sent_at.pop(response.index, None)
+                    if t_sent is None:
+                        # we had given up on this request and were about to send it again
+                        unsent.remove(response.index)
+                    # only time requests sent once; otherwise we can't tell which one was answered
+                    if t_sent is None or attempts[response.index] != 1:
+                        self._on_request_answered(None)
+                    else:
+                        self._on_request_answered(trio.current_time() - t_sent)
+                    if response.error is None:
+                        result._set_value(response.index, response.value, response.timestamp)
+                    else:
+                        result.errors[response.index] = response.error
+                    continue
+
+                now = trio.current_time()
+                if deadline <= now:
+                    break
+                lost = [index for index, t in sent_at.items() if t + self._retry_interval() <= now]
+                if lost:
+                    burst = 0
+                    self._on_requests_lost()
+                    for index in lost:
+                        del sent_at[index]
+                        self._request_metrics.on_lost(index)
+                    unsent.extend(lost)
+        finally:
+            for response in responses.values():
+                self._abandon_response(response)
+
+        for index, response in responses.items():
+            if not response.event.is_set():
+                self._request_metrics.on_timeout(index)
+                result.errors[index] = RoverException(
+                    f"No response for data element {index} after {attempts[index]} requests"
+                )
+
 
 async def get_rover_version(port):
     try:
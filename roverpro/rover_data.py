@@ -1,8 +1,13 @@
 import abc
 import enum
 import functools
+import itertools
+import math
 import re
-from typing import NamedTuple, Optional
+import struct
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from .util import UnsupportedDataElement
 
 
 class ReadDataFormat(abc.ABC):
@@ -16,6 +21,54 @@ class ReadDataFormat(abc.ABC):
     def unpack(self, b: bytes):
         raise NotImplementedError
 
+    def compile_unpack(self) -> Callable[[bytes], Any]:
+        """Return a function equivalent to self.unpack, specialized for speed"""
+        return self.unpack
+
+    # number of bytes of a packed value
+    nbytes = 2
+
+    def unpack_many(self, data):
+        """Unpack many packed values at once into a NumPy array. Requires NumPy.
+        :param data: the packed values, as bytes or as a uint8 array of shape (n, nbytes)
+        """
+        np = import_numpy()
+        rows = _as_rows(data, self.nbytes)
+        result = np.empty(len(rows), dtype=object)
+        for i, row in enumerate(rows):
+            result[i] = self.unpack(row.tobytes())
+        return result
+
+
+def import_numpy():
+    """Import NumPy, an optional dependency installed with the `analysis` extra"""
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("Decoding many values at once requires NumPy") from e
+    return numpy
+
+
+def _as_rows(data, nbytes):
+    """The given packed values, as a uint8 array with one row per value"""
+    np = import_numpy()
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = np.frombuffer(data, dtype=np.uint8)
+    return np.ascontiguousarray(data, dtype=np.uint8).reshape(-1, nbytes)
+
+
+def _unpack_many_uint16(data):
+    return UINT16.unpack_many(data)
+
+
+def _unpack_many_flags(raw, bit_meanings):
+    """Translate an array of raw values into an array of flag values, given (mask, flag) pairs"""
+    np = import_numpy()
+    result = np.zeros(len(raw), dtype=np.int64)
+    for mask, flag in bit_meanings:
+        result |= np.where(raw & mask, flag.value, 0)
+    return result
+
 
 class WriteDataFormat(abc.ABC):
     python_type = None
@@ -45,20 +98,47 @@ class IntDataFormat(ReadDataFormat, WriteDataFormat):
     def unpack(self, b: bytes):
         return int.from_bytes(b, byteorder="big", signed=self.signed)
 
+    @property
+    def struct_format(self):
+        code = {1: "b", 2: "h", 4: "i", 8: "q"}[self.nbytes]
+        return ">" + (code if self.signed else code.upper())
+
+    def compile_unpack(self):
+        struct_unpack = struct.Struct(self.struct_format).unpack
+
+        def unpack(b):
+            return struct_unpack(b)[0]
+
+        return unpack
+
+    def unpack_many(self, data):
+        np = import_numpy()
+        dtype = ">{}{}".format("i" if self.signed else "u", self.nbytes)
+        return _as_rows(data, self.nbytes).view(dtype)[:, 0].astype(np.int64)
+
 
 ROVER_LEGACY_VERSION = 40621
 
 
+# major, minor, and patch numbers, then optional prerelease and build labels. e.g. 1.10.0-rc1+abc
+_VERSION_RE = re.compile(r"(\d+)(?:[.](\d+))?(?:[.](\d+))?(?:-([^+]+))?(?:[+](.+))?")
+
+
 @functools.total_ordering
 class RoverFirmwareVersion(NamedTuple):
     @classmethod
     def parse(cls, a_str):
-        ver_re = re.compile(r"(\d+(?:[.]\d+){0,2})(?:-([^+])+)?(?:[+](.+))?", re.VERBOSE)
-        match = ver_re.fullmatch(a_str)
+        match = _VERSION_RE.fullmatch(a_str)
         if match is None:
-            raise ValueError
-        parts = [int(p) for p in match.group(0).split(".")]
-        return RoverFirmwareVersion(*parts)
+            raise ValueError(f"Invalid firmware version {a_str!r}")
+        major, minor, patch, prerelease, build = match.groups()
+        return RoverFirmwareVersion(
+            int(major),
+            int(minor or 0),
+            int(patch or 0),
+            build=build or "",
+            prerelease=prerelease or "",
+        )
 
     major: int
     minor: int = 0
@@ -87,7 +167,7 @@ class RoverFirmwareVersion(NamedTuple):
         )
 
 
-class DataFormatFirmwareVersion(ReadDataFormat):
+class DataFormatFirmwareVersion(ReadDataFormat, WriteDataFormat):
     python_type = RoverFirmwareVersion
 
     def unpack(self, b):
@@ -96,6 +176,9 @@ class DataFormatFirmwareVersion(ReadDataFormat):
             return RoverFirmwareVersion(1, 0, 0)
         return RoverFirmwareVersion(v // 10000, v // 100 % 100, v % 10)
 
+    def pack(self, value: RoverFirmwareVersion):
+        return UINT16.pack(value.major * 10000 + value.minor * 100 + value.patch)
+
     def description(self):
         return (
             "XYYZZ, where X=major version, Y=minor version, Z = patch version."
@@ -117,6 +200,16 @@ class DataFormatChargerState(ReadDataFormat, WriteDataFormat):
     def unpack(self, b):
         return bytes(b) == self.CHARGER_ACTIVE_MAGIC_BYTES
 
+    def compile_unpack(self):
+        active = self.CHARGER_ACTIVE_MAGIC_BYTES
+        # unlike active.__eq__, this is a bool for bytearrays and memoryviews too
+        return lambda b: b == active
+
+    def unpack_many(self, data):
+        np = import_numpy()
+        active = np.frombuffer(self.CHARGER_ACTIVE_MAGIC_BYTES, dtype=np.uint8)
+        return (_as_rows(data, 2) == active).all(axis=1)
+
     def description(self):
         return "0xDADA if charging, else 0x0000"
 
@@ -134,29 +227,56 @@ class BatteryStatus(enum.Flag):
     fully_discharged = enum.auto()
 
 
-class DataFormatBatteryStatus(ReadDataFormat):
+class DataFormatBatteryStatus(ReadDataFormat, WriteDataFormat):
     python_type = BatteryStatus
+    bit_meanings = (
+        (0x8000, BatteryStatus.overcharged_alarm),
+        (0x4000, BatteryStatus.terminate_charge_alarm),
+        (0x1000, BatteryStatus.over_temp_alarm),
+        (0x0800, BatteryStatus.terminate_discharge_alarm),
+        (0x0200, BatteryStatus.remaining_capacity_alarm),
+        (0x0100, BatteryStatus.remaining_time_alarm),
+        (0x0080, BatteryStatus.initialized),
+        (0x0040, BatteryStatus.discharging),
+        (0x0020, BatteryStatus.fully_charged),
+        (0x0010, BatteryStatus.fully_discharged),
+    )
 
     def unpack(self, b: bytes):
         assert len(b) == 2
         as_int = int.from_bytes(b, byteorder="big", signed=False)
         result = BatteryStatus(0)
-        for mask, val in (
-            (0x8000, BatteryStatus.overcharged_alarm),
-            (0x4000, BatteryStatus.terminate_charge_alarm),
-            (0x1000, BatteryStatus.over_temp_alarm),
-            (0x0800, BatteryStatus.terminate_discharge_alarm),
-            (0x0200, BatteryStatus.remaining_capacity_alarm),
-            (0x0100, BatteryStatus.remaining_time_alarm),
-            (0x0080, BatteryStatus.initialized),
-            (0x0040, BatteryStatus.discharging),
-            (0x0020, BatteryStatus.fully_charged),
-            (0x0010, BatteryStatus.fully_discharged),
-        ):
+        for mask, val in self.bit_meanings:
             if as_int & mask:
                 result |= val
         return result
 
+    def compile_unpack(self):
+        all_bits = 0
+        for mask, _ in self.bit_meanings:
+            all_bits |= mask
+        # every combination of meaningful bits -> the corresponding flag value
+        table = {}
+        for n in range(len(self.bit_meanings) + 1):
+            for combination in itertools.combinations(self.bit_meanings, n):
+                flag = BatteryStatus(0)
+                for _, val in combination:
+                    flag |= val
+                table[sum(mask for mask, _ in combination)] = flag
+        struct_unpack = struct.Struct(UINT16.struct_format).unpack
+
+        def unpack(b):
+            return table[struct_unpack(b)[0] & all_bits]
+
+        return unpack
+
+    def unpack_many(self, data):
+        """Unpack many values at once into an array of BatteryStatus values as integers"""
+        return _unpack_many_flags(_unpack_many_uint16(data), self.bit_meanings)
+
+    def pack(self, value: BatteryStatus):
+        return UINT16.pack(sum(mask for mask, val in self.bit_meanings if val in value))
+
     def description(self):
         return "bit flags"
 
@@ -185,6 +305,23 @@ class DataFormatFixedPrecision(ReadDataFormat, WriteDataFormat):
         n = self.base_type.unpack(b)
         return (n - self.zero) / self.step
 
+    def compile_unpack(self):
+        struct_unpack = struct.Struct(self.base_type.struct_format).unpack
+        zero = self.zero
+        step = self.step
+
+        def unpack(b):
+            return (struct_unpack(b)[0] - zero) / step
+
+        return unpack
+
+    @property
+    def nbytes(self):
+        return self.base_type.nbytes
+
+    def unpack_many(self, data):
+        return (self.base_type.unpack_many(data) - self.zero) / self.step
+
     def pack(self, p):
         n = round(p * self.step + self.zero)
         return self.base_type.pack(n)
@@ -195,12 +332,24 @@ class DataFormatFixedPrecision(ReadDataFormat, WriteDataFormat):
         )
 
 
-class DataFormatDriveMode(ReadDataFormat):
+class DataFormatDriveMode(ReadDataFormat, WriteDataFormat):
     python_type = DriveMode
 
     def unpack(self, b: bytes):
         return DriveMode(UINT16.unpack(b))
 
+    def compile_unpack(self):
+        return _compile_enum_table_unpack(
+            self.unpack, [DriveMode(i) for i in range(len(DriveMode))]
+        )
+
+    def unpack_many(self, data):
+        """Unpack many values at once into an array of DriveMode values as integers"""
+        result = _unpack_many_uint16(data)
+        if len(DriveMode) <= result.max(initial=0):
+            raise ValueError("invalid drive mode")
+        return result
+
     def pack(self, p: DriveMode):
         return UINT16.pack(p.value)
 
@@ -233,30 +382,73 @@ class MotorStatusFlag(enum.Flag):
     COAST = enum.auto()
 
 
-class DataFormatMotorStatus(ReadDataFormat):
+def _compile_enum_table_unpack(slow_unpack, table):
+    """Decode a UINT16 by looking it up in table, deferring to slow_unpack for any value outside
+    the table (which is expected to raise the appropriate error)"""
+    struct_unpack = struct.Struct(UINT16.struct_format).unpack
+
+    def unpack(b):
+        try:
+            return table[struct_unpack(b)[0]]
+        except IndexError:
+            return slow_unpack(b)
+
+    return unpack
+
+
+def _compile_flag_unpack(data_format):
+    """Compile the unpack function of a data format whose bit_meanings list gives the flag for
+    each bit, starting at the least significant"""
+    table = [data_format.unpack(UINT16.pack(i)) for i in range(2 ** len(data_format.bit_meanings))]
+    return _compile_enum_table_unpack(data_format.unpack, table)
+
+
+def _unpack_many_bit_flags(data_format, data):
+    """unpack_many for a data format whose bit_meanings list gives the flag for each bit,
+    starting at the least significant"""
+    raw = _unpack_many_uint16(data)
+    if 1 << len(data_format.bit_meanings) <= raw.max(initial=0):
+        raise ValueError("too many bits to unpack")
+    return _unpack_many_flags(raw, [(1 << i, f) for i, f in enumerate(data_format.bit_meanings)])
+
+
+class DataFormatMotorStatus(ReadDataFormat, WriteDataFormat):
+    bit_meanings = [
+        MotorStatusFlag.FAULT1,
+        MotorStatusFlag.FAULT2,
+        MotorStatusFlag.DECAY_MODE,
+        MotorStatusFlag.REVERSE,
+        MotorStatusFlag.BRAKE,
+        MotorStatusFlag.COAST,
+    ]
+
     def description(self):
         return "motor status bit flags"
 
     def unpack(self, b: bytes):
         u = UINT16.unpack(b)
 
-        bit_meanings = [
-            MotorStatusFlag.FAULT1,
-            MotorStatusFlag.FAULT2,
-            MotorStatusFlag.DECAY_MODE,
-            MotorStatusFlag.REVERSE,
-            MotorStatusFlag.BRAKE,
-            MotorStatusFlag.COAST,
-        ]
-        if len(bit_meanings) <= u.bit_length():
+        if len(self.bit_meanings) < u.bit_length():
             raise ValueError("too many bits to unpack")
 
         result = MotorStatusFlag.NONE
-        for i, flag in enumerate(bit_meanings):
+        for i, flag in enumerate(self.bit_meanings):
             if u & 1 << i:
                 result |= flag
         return result
 
+    def compile_unpack(self):
+        return _compile_flag_unpack(self)
+
+    def unpack_many(self, data):
+        """Unpack many values at once into an array of flag values as integers"""
+        return _unpack_many_bit_flags(self, data)
+
+    def pack(self, value: MotorStatusFlag):
+        return UINT16.pack(
+            sum(1 << i for i, flag in enumerate(self.bit_meanings) if flag in value)
+        )
+
 
 class DataFormatIgnored(WriteDataFormat):
     def description(self):
@@ -276,23 +468,36 @@ class SystemFaultFlag(enum.Flag):
     OVERCURRENT = enum.auto()
 
 
-class DataFormatSystemFault(ReadDataFormat):
+class DataFormatSystemFault(ReadDataFormat, WriteDataFormat):
+    bit_meanings = [SystemFaultFlag.OVERSPEED, SystemFaultFlag.OVERCURRENT]
+
     def description(self):
         return "System fault bit flags"
 
     def unpack(self, b: bytes):
         u = UINT16.unpack(b)
 
-        bit_meanings = [SystemFaultFlag.OVERSPEED, SystemFaultFlag.OVERCURRENT]
-        if len(bit_meanings) <= u.bit_length():
+        if len(self.bit_meanings) < u.bit_length():
             raise ValueError("too many bits to unpack")
 
         result = SystemFaultFlag.NONE
-        for i, flag in enumerate(bit_meanings):
+        for i, flag in enumerate(self.bit_meanings):
             if u & 1 << i:
                 result |= flag
         return result
 
+    def compile_unpack(self):
+        return _compile_flag_unpack(self)
+
+    def unpack_many(self, data):
+        """Unpack many values at once into an array of flag values as integers"""
+        return _unpack_many_bit_flags(self, data)
+
+    def pack(self, value: SystemFaultFlag):
+        return UINT16.pack(
+            sum(1 << i for i, flag in enumerate(self.bit_meanings) if flag in value)
+        )
+
 
 class DataElement:
     def __init__(
@@ -304,6 +509,7 @@ class DataElement:
         not_implemented: bool = False,
         since: Optional[str] = None,
         until: Optional[str] = None,
+        max_age: float = 0,
     ):
         self.index = index
         self.data_format = data_format
@@ -312,6 +518,8 @@ class DataElement:
         self.not_implemented = not_implemented
         self.since_version = None if since is None else RoverFirmwareVersion.parse(since)
         self.until_version = None if until is None else RoverFirmwareVersion.parse(until)
+        # how many seconds a received value may be reused instead of requesting it again
+        self.max_age = max_age
 
     def supported(self, version):
         if isinstance(version, str):
@@ -325,11 +533,15 @@ class DataElement:
 
         if self.not_implemented:
             return False
-        if self.since_version is not None and v < self.since_version:
+        return self.answered_by(v)
+
+    def answered_by(self, version: RoverFirmwareVersion) -> bool:
+        """Whether firmware of the given version responds to requests for this data element.
+        Unlike supported, this is True for elements whose values are not implemented."""
+        if self.since_version is not None and version < self.since_version:
+            return False
+        if self.until_version is not None and self.until_version <= version:
             return False
-        if self.until_version is not None:
-            if self.until_version <= v:
-                return False
         return True
 
 
@@ -396,26 +608,28 @@ elements = [
         PERCENTAGE_FORMAT,
         "battery A state of charge",
         "Proportional charge, 0.0=empty, 1.0=full",
+        max_age=5,
     ),
     DataElement(
         36,
         PERCENTAGE_FORMAT,
         "battery B state of charge",
         "Proportional charge, 0.0=empty, 1.0=full",
+        max_age=5,
     ),
-    DataElement(38, CHARGER_STATE_FORMAT, "battery charging state"),
-    DataElement(40, FIRMWARE_VERSION_FORMAT, "release version"),
+    DataElement(38, CHARGER_STATE_FORMAT, "battery charging state", max_age=1),
+    DataElement(40, FIRMWARE_VERSION_FORMAT, "release version", max_age=math.inf),
     DataElement(42, OLD_CURRENT_FORMAT, "battery A current (external)"),
     DataElement(44, OLD_CURRENT_FORMAT, "battery B current (external)"),
     DataElement(46, UINT16, "motor flipper angle"),
     DataElement(48, FAN_SPEED_RESPONSE_FORMAT, "fan speed"),
     DataElement(50, DRIVE_MODE_FORMAT, "drive mode", until="1.7"),
-    DataElement(52, BATTERY_STATUS_FORMAT, "battery A status", since="1.2"),
-    DataElement(54, BATTERY_STATUS_FORMAT, "battery B status", since="1.2"),
-    DataElement(56, UINT16, "battery A mode", since="1.2"),
-    DataElement(58, UINT16, "battery B mode", since="1.2"),
-    DataElement(60, DECIKELVIN_FORMAT, "battery A temperature (internal)", since="1.2"),
-    DataElement(62, DECIKELVIN_FORMAT, "battery B temperature (internal)", since="1.2"),
+    DataElement(52, BATTERY_STATUS_FORMAT, "battery A status", since="1.2", max_age=1),
+    DataElement(54, BATTERY_STATUS_FORMAT, "battery B status", since="1.2", max_age=1),
+    DataElement(56, UINT16, "battery A mode", since="1.2", max_age=5),
+    DataElement(58, UINT16, "battery B mode", since="1.2", max_age=5),
+    DataElement(60, DECIKELVIN_FORMAT, "battery A temperature (internal)", since="1.2", max_age=5),
+    DataElement(62, DECIKELVIN_FORMAT, "battery B temperature (internal)", since="1.2", max_age=5),
     DataElement(64, UNSIGNED_MILLIS_FORMAT, "battery A voltage (internal)", since="1.2"),
     DataElement(66, UNSIGNED_MILLIS_FORMAT, "battery B voltage (internal)", since="1.2"),
     DataElement(
@@ -443,6 +657,46 @@ elements = [
 ROVER_DATA_ELEMENTS = {e.index: e for e in elements}
 
 
+def _compile_decoders():
+    decoders = [None] * 256
+    for e in elements:
+        decoders[e.index] = e.data_format.compile_unpack()
+    return tuple(decoders)
+
+
+# data element index -> function to convert a frame payload to a python value (or None)
+ROVER_DATA_DECODERS = _compile_decoders()
+
+
+class SupportedElements:
+    def __init__(self, version: RoverFirmwareVersion):
+        """The data elements firmware of the given version responds to, and their decoders.
+        Use supported_elements(version), which builds this once per version."""
+        self.version = version
+        # data element index -> element, for each element this version responds to
+        self.elements = {
+            i: e for i, e in ROVER_DATA_ELEMENTS.items() if e.answered_by(version)
+        }  # type: Dict[int, DataElement]
+        # like ROVER_DATA_DECODERS, but None for elements this version doesn't respond to
+        self.decoders = tuple(
+            decoder if i in self.elements else None
+            for i, decoder in enumerate(ROVER_DATA_DECODERS)
+        )
+
+    def __contains__(self, index: int) -> bool:
+        return index in self.elements
+
+    def check(self, index: int):
+        """Raise UnsupportedDataElement if this firmware version won't respond to the index"""
+        if index not in self.elements:
+            raise UnsupportedDataElement(index, self.version)
+
+
+@functools.lru_cache(maxsize=None)
+def supported_elements(version: RoverFirmwareVersion) -> SupportedElements:
+    return SupportedElements(version)
+
+
 def strike(s):
     return f"~~{s}~~"
 
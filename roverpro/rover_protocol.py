@@ -1,11 +1,11 @@
+import collections
 import enum
-from typing import Any, Tuple
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
 import trio
 
-from .rover_data import MOTOR_EFFORT_FORMAT, ROVER_DATA_ELEMENTS
+from .rover_data import MOTOR_EFFORT_FORMAT, ROVER_DATA_DECODERS
 from .serial_trio import SerialTrio
-from .util import RoverException
 
 SERIAL_START_BYTE = bytes.fromhex("fd")
 
@@ -46,38 +46,243 @@ def checksum(values):
     return 255 - sum(values) % 255
 
 
+# the wire byte of each quantized motor effort, as MOTOR_EFFORT_FORMAT packs it
+_EFFORT_BYTES = tuple(MOTOR_EFFORT_FORMAT.base_type.pack(n)[0] for n in range(256))
+
+
+class CommandEncoder:
+    """Builds command frames, reusing work between frames with similar contents.
+
+    Motor efforts are quantized and looked up in a table of all 256 byte values, the checksum of
+    the motor bytes is kept between frames, and recently built frames are returned again without
+    rebuilding.
+    """
+
+    # maximum number of recently built frames to remember
+    FRAME_CACHE_SIZE = 32
+
+    def __init__(self):
+        self._frames = collections.OrderedDict()  # type: Dict[tuple, bytes]
+        self._frame = bytearray(7)
+        self._frame[0] = SERIAL_START_BYTE[0]
+        self._motors = None  # type: Optional[Tuple[float, float, float]]
+        self._motor_sum = 0
+
+    @staticmethod
+    def _effort_byte(effort: float) -> int:
+        n = round(effort * MOTOR_EFFORT_FORMAT.step + MOTOR_EFFORT_FORMAT.zero)
+        if not 0 <= n < len(_EFFORT_BYTES):
+            # fail the same way encode_packet would
+            MOTOR_EFFORT_FORMAT.pack(effort)
+        return _EFFORT_BYTES[n]
+
+    def encode(
+        self, motor_left: float, motor_right: float, flipper: float, verb: int, arg: int
+    ) -> bytes:
+        """Return the same frame as encode_packet would for these motor efforts and command"""
+        key = (motor_left, motor_right, flipper, verb, arg)
+        frames = self._frames
+        frame = frames.get(key)
+        if frame is not None:
+            frames.move_to_end(key)
+            return frame
+
+        buffer = self._frame
+        motors = key[:3]
+        if motors != self._motors:
+            buffer[1] = self._effort_byte(motor_left)
+            buffer[2] = self._effort_byte(motor_right)
+            buffer[3] = self._effort_byte(flipper)
+            self._motors = motors
+            self._motor_sum = buffer[1] + buffer[2] + buffer[3]
+        buffer[4] = verb
+        buffer[5] = arg
+        buffer[6] = 255 - (self._motor_sum + verb + arg) % 255
+
+        frame = bytes(buffer)
+        frames[key] = frame
+        if len(frames) > self.FRAME_CACHE_SIZE:
+            frames.popitem(last=False)
+        return frame
+
+
+class FrameDecoder:
+    """Incrementally splits a stream of bytes from the rover into checksum-valid frames.
+
+    Each frame is SERIAL_START_BYTE, a data element index, two bytes of data, and a checksum.
+    Corrupt frames are counted and skipped; decoding resumes at the next candidate start byte.
+    """
+
+    FRAME_LENGTH = 5
+
+    def __init__(self):
+        self._buffer = bytearray()
+        # number of frames discarded because of a bad checksum
+        self.n_bad_frames = 0
+        # number of bytes discarded while searching for the start of a frame
+        self.n_skipped_bytes = 0
+
+    def feed(self, data: bytes) -> List[Tuple[int, bytes]]:
+        """Add received bytes and return every complete (index, payload) frame now available"""
+        buffer = self._buffer
+        buffer += data
+        result = []
+        start_byte = SERIAL_START_BYTE[0]
+        frame_length = self.FRAME_LENGTH
+        end = len(buffer)
+        pos = 0
+        while True:
+            start = buffer.find(start_byte, pos)
+            if start < 0:
+                self.n_skipped_bytes += end - pos
+                pos = end
+                break
+            self.n_skipped_bytes += start - pos
+            if end < start + frame_length:
+                pos = start
+                break
+            index, hi, lo, actual_checksum = buffer[start + 1 : start + frame_length]
+            if actual_checksum == 255 - (index + hi + lo) % 255:
+                result.append((index, bytes((hi, lo))))
+                pos = start + frame_length
+            else:
+                # not a real frame. Try again from the next byte.
+                self.n_bad_frames += 1
+                self.n_skipped_bytes += 1
+                pos = start + 1
+        del buffer[:pos]
+        return result
+
+
+class CommandQueue:
+    """Commands waiting to be sent while the serial device is backlogged.
+
+    Commands are taken out in priority order: settings and other one-off commands first, in the
+    order they were queued, then GET_DATA requests, then a NOP. Settings are never dropped.
+    Every frame carries the motor efforts, so at most one NOP is queued, and it is dropped once
+    any other command is taken. A GET_DATA request for an element that is already queued is
+    collapsed into the queued one.
+    """
+
+    def __init__(self, max_requests: int = 16):
+        # maximum number of distinct GET_DATA requests to hold
+        self.max_requests = max_requests
+        self._commands = collections.deque()  # type: Deque[Tuple[CommandVerb, int]]
+        # data element index -> None, in the order requested
+        self._requests = collections.OrderedDict()  # type: Dict[int, None]
+        self._nop = False
+        self._space_available = trio.lowlevel.ParkingLot()
+        # number of commands not queued because an equivalent one already was
+        self.n_collapsed = 0
+        # most commands ever waiting at once
+        self.max_len = 0
+
+    def __len__(self):
+        return len(self._commands) + len(self._requests) + self._nop
+
+    def put_nowait(self, verb: CommandVerb, arg: int):
+        """Queue a command. Raises trio.WouldBlock if a GET_DATA request does not fit"""
+        if verb == CommandVerb.NOP:
+            self.n_collapsed += self._nop
+            self._nop = True
+        elif verb == CommandVerb.GET_DATA:
+            if arg in self._requests:
+                self.n_collapsed += 1
+            elif len(self._requests) < self.max_requests:
+                self._requests[arg] = None
+            else:
+                raise trio.WouldBlock
+        else:
+            self._commands.append((verb, arg))
+        n = len(self)
+        if self.max_len < n:
+            self.max_len = n
+
+    async def wait_space_available(self):
+        """Wait until a GET_DATA request can be queued"""
+        while self.max_requests <= len(self._requests):
+            await self._space_available.park()
+
+    def get_nowait(self) -> Tuple[CommandVerb, int]:
+        """Remove and return the next command to send. Raises trio.WouldBlock if empty"""
+        if self._commands:
+            command = self._commands.popleft()
+        elif self._requests:
+            index, _ = self._requests.popitem(last=False)
+            command = (CommandVerb.GET_DATA, index)
+            self._space_available.unpark()
+        elif self._nop:
+            command = (CommandVerb.NOP, 0)
+        else:
+            raise trio.WouldBlock
+        self._nop = False
+        return command
+
+
 class RoverProtocol:
-    def __init__(self, serial: SerialTrio):
-        """Low-level communication for Rover Pro"""
+    def __init__(self, serial: SerialTrio, capture=None):
+        """Low-level communication for Rover Pro
+        :param capture: if given, a roverpro.capture.FrameCapture to record all frames into"""
         self._serial = serial
-        # A packet involves multiple read operations, so we must lock the device for reading
+        self.capture = capture
+        # number of checksum-valid frames received and of command frames sent
+        self.n_frames_received = 0
+        self.n_frames_sent = 0
+        self._encoder = CommandEncoder()
+        self._decoder = FrameDecoder()
+        # frames which have been received and decoded but not yet consumed
+        self._pending_frames = collections.deque()
+        # Filling the pending frame queue involves multiple operations, so we must lock the
+        # device for reading
         self._read_lock = trio.StrictFIFOLock()
 
+    @property
+    def decoder(self) -> FrameDecoder:
+        return self._decoder
+
+    @staticmethod
+    def unpack(index: int, payload: bytes) -> Any:
+        """Convert the payload of a frame to the python value of the given data element"""
+        return ROVER_DATA_DECODERS[index](payload)
+
+    async def _receive_frames(self):
+        """Wait for more data and decode every complete frame it contains"""
+        while True:
+            data = await self._serial.receive_some()
+            frames = self._decoder.feed(data)
+            self.n_frames_received += len(frames)
+            if self.capture is not None:
+                self.capture.record_inbound(frames)
+            frames = [
+                (index, payload)
+                for index, payload in frames
+                if ROVER_DATA_DECODERS[index] is not None
+            ]
+            if frames:
+                return frames
+
     async def read_one(self) -> Tuple[int, Any]:
-        raw_data = await self._read_one_raw()
-        data_element_index = raw_data[0]
-        element_descriptor = ROVER_DATA_ELEMENTS[data_element_index]
-        data_element_value = element_descriptor.data_format.unpack(raw_data[1:])
-        return data_element_index, data_element_value
-
-    async def _read_one_raw(self) -> bytes:
-        """Reads a packet, verifies its checksum, and returns the packet payload"""
         async with self._read_lock:
-            _ = await self._serial.read_until(SERIAL_START_BYTE)
-
-            payload = await self._serial.read_exactly(3)
+            if not self._pending_frames:
+                self._pending_frames.extend(await self._receive_frames())
+            index, payload = self._pending_frames.popleft()
+        return index, self.unpack(index, payload)
 
-            (actual_checksum,) = await self._serial.read_exactly(1)
+    async def read_frames(self) -> List[Tuple[int, bytes]]:
+        """Return the index and raw payload of all received frames.
+        Waits for at least one if none are ready"""
+        async with self._read_lock:
+            if not self._pending_frames:
+                self._pending_frames.extend(await self._receive_frames())
+            frames = list(self._pending_frames)
+            self._pending_frames.clear()
+        return frames
 
-            expected_checksum = checksum(payload)
-            if actual_checksum == expected_checksum:
-                return payload
-            else:
-                raise RoverException(
-                    "Bad checksum {}, expected {}. Discarding data {}".format(
-                        list(actual_checksum), list(expected_checksum), list(payload)
-                    )
-                )
+    async def read_many(self) -> List[Tuple[int, Any]]:
+        """Return all received data elements, waiting for at least one if none are ready"""
+        return [
+            (index, self.unpack(index, payload)) for index, payload in await self.read_frames()
+        ]
 
     async def flush(self):
         await self._serial.flush(0)
@@ -90,10 +295,8 @@ class RoverProtocol:
         command_verb: CommandVerb,
         command_arg: int,
     ):
-        binary = encode_packet(
-            MOTOR_EFFORT_FORMAT.pack(motor_left),
-            MOTOR_EFFORT_FORMAT.pack(motor_right),
-            MOTOR_EFFORT_FORMAT.pack(flipper),
-            bytes([command_verb, command_arg]),
-        )
+        binary = self._encoder.encode(motor_left, motor_right, flipper, command_verb, command_arg)
+        if self.capture is not None:
+            self.capture.record_outbound(binary)
         self._serial.write_nowait(binary)
+        self.n_frames_sent += 1
@@ -0,0 +1,137 @@
+"""Share the serial link between polled data elements by priority.
+
+async with open_rover() as rover:
+    rover.poll_scheduler.declare(14, priority=10, min_rate=25)
+    rover.poll_scheduler.declare(64, priority=1)
+    with rover.subscribe({14: 50, 16: 50, 64: 1}):
+        ...
+        print(rover.poll_scheduler.report())
+
+Each request for a data element takes a 7-byte frame, so at 57600 baud the link carries about
+800 of them per second. When subscribers ask for more than that, higher priority elements get
+their rates first and lower priority ones are slowed down or not polled at all.
+"""
+
+import collections
+from typing import Any, Callable, Deque, Dict, NamedTuple, Optional
+
+import trio
+
+from .metrics import BITS_PER_BYTE
+
+# start byte, 3 motor efforts, verb, argument, checksum
+COMMAND_FRAME_LENGTH = 7
+
+
+def link_capacity(baudrate: float) -> float:
+    """Most requests per second a serial link at the given baud rate can carry"""
+    return baudrate / (BITS_PER_BYTE * COMMAND_FRAME_LENGTH)
+
+
+class PollPolicy(NamedTuple):
+    # elements with higher priority get their polling rate first
+    priority: float = 0
+    # if the element can't be polled at least this often, don't poll it at all
+    min_rate: float = 0
+
+
+class PollScheduler:
+    def __init__(
+        self,
+        capacity: float = link_capacity(57600),
+        headroom: float = 0.8,
+        window: float = 2.0,
+        on_change: Optional[Callable[[], None]] = None,
+    ):
+        """Decides how often to poll each subscribed data element, within the link's capacity.
+        :param capacity: requests per second the link can carry
+        :param headroom: fraction of the capacity to plan for. The rest is left for commands and
+            one-off requests.
+        :param window: achieved rates are measured over this many seconds
+        :param on_change: called when a policy changes, so the plan can be recomputed
+        """
+        if not 0 < headroom <= 1:
+            raise ValueError("headroom must be between 0 and 1")
+        self.capacity = capacity
+        self.headroom = headroom
+        self.window = window
+        self._on_change = on_change
+        # data element index -> how to poll it, for elements with a declared policy
+        self.policies = {}  # type: Dict[int, PollPolicy]
+        # the rates asked for and planned at the last call to plan()
+        self.desired = {}  # type: Dict[int, float]
+        self.planned = {}  # type: Dict[int, float]
+        # data element index -> when samples of it were received, over the last window
+        self._received = {}  # type: Dict[int, Deque[float]]
+
+    def declare(self, index: int, priority: float = 0, min_rate: float = 0):
+        """Set how important polling the given data element is, and the slowest rate worth
+        polling it at"""
+        if min_rate < 0:
+            raise ValueError("min_rate must not be negative")
+        self.policies[index] = PollPolicy(priority, min_rate)
+        if self._on_change is not None:
+            self._on_change()
+
+    @property
+    def budget(self) -> float:
+        """Requests per second available for polling"""
+        return self.capacity * self.headroom
+
+    def plan(self, desired: Dict[int, float]) -> Dict[int, float]:
+        """Rates to poll the given data elements at, given the rates subscribers asked for.
+        Elements are given their minimum rates in order of priority, then raised towards the
+        rates asked for in the same order. An element whose minimum rate doesn't fit is left out.
+        """
+        default = PollPolicy()
+        by_priority = sorted(
+            desired, key=lambda index: -self.policies.get(index, default).priority
+        )
+        remaining = self.budget
+        planned = {}
+        for index in by_priority:
+            min_rate = min(self.policies.get(index, default).min_rate, desired[index])
+            if min_rate <= remaining:
+                planned[index] = min_rate
+                remaining -= min_rate
+        for index in by_priority:
+            if index in planned:
+                extra = min(desired[index] - planned[index], remaining)
+                planned[index] += extra
+                remaining -= extra
+        self.desired = dict(desired)
+        self.planned = {index: rate for index, rate in planned.items() if rate > 0}
+        return self.planned
+
+    def on_sample(self, index: int, now: float):
+        """Record that a value of a polled data element was received"""
+        received = self._received.get(index)
+        if received is None:
+            received = self._received[index] = collections.deque()
+        received.append(now)
+        while received[0] <= now - self.window:
+            received.popleft()
+
+    def achieved_rates(self, now: Optional[float] = None) -> Dict[int, float]:
+        """Samples per second received of each polled data element, over the window ending at
+        now, which defaults to trio.current_time()"""
+        if now is None:
+            now = trio.current_time()
+        return {
+            index: sum(now - self.window < t for t in received) / self.window
+            for index, received in self._received.items()
+        }
+
+    def report(self, now: Optional[float] = None) -> Dict[int, Dict[str, Any]]:
+        """For each data element subscribers asked for: its priority, and the rates asked for,
+        planned, and achieved as of now, which defaults to trio.current_time()"""
+        achieved = self.achieved_rates(now)
+        return {
+            index: {
+                "priority": self.policies.get(index, PollPolicy()).priority,
+                "desired": rate,
+                "planned": self.planned.get(index, 0.0),
+                "achieved": achieved.get(index, 0.0),
+            }
+            for index, rate in sorted(self.desired.items())
+        }
@@ -1,12 +1,14 @@
 import errno
-import logging
+import io
 import warnings
+from typing import AsyncContextManager, Optional
 
 import serial
 import serial.tools
 import serial.tools.list_ports
 import trio
 
+from .metrics import BITS_PER_BYTE
 from .util import RoverException
 
 
@@ -21,11 +23,21 @@ class DeviceClosedException(serial.SerialException):
 class SerialTrio(trio.abc.AsyncResource):
     _serial = None  # type: serial.Serial
     _inbound_high_water = 4000
-    _outbound_high_water = 8000
+    # maximum number of bytes to pull from the OS in a single read
+    _read_chunk_size = 4096
+    # how often to check for incoming data when the device cannot be waited on
+    _poll_interval = 0.001
+    _fileno = None
+    # if set, a roverpro.tracing.Tracer to record writes into
+    tracer = None
 
-    def __init__(self, port, **serial_kwargs):
-        """Wrapper for pyserial that makes it work better with async"""
+    def __init__(self, port, flush_delay_us=0, **serial_kwargs):
+        """Wrapper for pyserial that makes it work better with async.
+        Used with `async with`, data written with write_nowait is buffered and sent in a single
+        write after the current scheduler tick, or after flush_delay_us microseconds if that is
+        nonzero. Otherwise, write_nowait hands data straight to the OS."""
         self.port = port
+        self.flush_delay_us = flush_delay_us
         self.serial_kwargs = {
             "write_timeout": 0,
             "inter_byte_timeout": None,
@@ -54,6 +66,32 @@ class SerialTrio(trio.abc.AsyncResource):
                 raise RoverException("Does not appear to be a serial device") from e
             raise RoverException("Could not connect to serial device.") from e
 
+        # bytes already pulled from the OS but not yet consumed by a reader
+        self._read_buffer = bytearray()
+        # bytes written by the caller but not yet handed to the OS
+        self._write_buffer = bytearray()
+        # bytes the OS had not yet sent, as of the last write or flush
+        self._os_out_waiting = 0
+        self._write_error = None
+        self._write_lock = trio.StrictFIFOLock()
+        self._flusher_lot = trio.lowlevel.ParkingLot()
+        self._flusher_scope = trio.CancelScope()
+        # while used as a context manager, the nursery the flusher runs in
+        self._nursery_manager = None  # type: Optional[AsyncContextManager[trio.Nursery]]
+        # number of write_nowait calls and of OS writes they were coalesced into
+        self.n_frames_written = 0
+        self.n_write_syscalls = 0
+        # number of bytes handed to and received from the OS
+        self.n_bytes_written = 0
+        self.n_bytes_read = 0
+        # most bytes received from the OS at once, and most bytes seen waiting to be sent
+        self.max_bytes_read = 0
+        self.max_out_waiting = 0
+        try:
+            self._fileno = self._serial.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            self._fileno = None
+
     @property
     def in_waiting(self):
         try:
@@ -64,68 +102,183 @@ class SerialTrio(trio.abc.AsyncResource):
             raise
 
     def _read_bytes_nowait(self, n_max):
-        if self._inbound_high_water <= self.in_waiting:
+        try:
+            data = self._serial.read(n_max)
+        except Exception as e:
+            if not self._serial.is_open:
+                raise DeviceClosedException from e
+            raise
+        n = len(data)
+        self.n_bytes_read += n
+        if self.max_bytes_read < n:
+            self.max_bytes_read = n
+        if self._inbound_high_water <= n:
             warnings.warn(
-                "Incoming buffer is backlogged. Data may be lost. {} bytes".format(
-                    self._serial.in_waiting
-                )
+                "Incoming buffer is backlogged. Data may be lost. {} bytes".format(len(data))
             )
-        return self._serial.read(n_max)
+        return data
+
+    async def _wait_readable(self):
+        if self._fileno is None:
+            # no pollable file descriptor (e.g. Windows). Fall back to polling.
+            await trio.sleep(self._poll_interval)
+        else:
+            await trio.lowlevel.wait_readable(self._fileno)
+
+    async def receive_some(self) -> bytes:
+        """Wait until at least one byte is available, then return all bytes that have arrived"""
+        if self._read_buffer:
+            data = bytes(self._read_buffer)
+            self._read_buffer.clear()
+            return data
+        while True:
+            data = self._read_bytes_nowait(self._read_chunk_size)
+            if data:
+                return data
+            await self._wait_readable()
 
     async def read_until(self, terminator):
         terminator = bytes(terminator)
         assert terminator != b""
-        line = bytearray()
+        while True:
+            i = self._read_buffer.find(terminator)
+            if i >= 0:
+                end = i + len(terminator)
+                line = bytes(self._read_buffer[:end])
+                del self._read_buffer[:end]
+                return line
+            self._read_buffer.extend(await self.receive_some())
+
+    async def read_exactly(self, count):
+        while len(self._read_buffer) < count:
+            self._read_buffer.extend(await self.receive_some())
+        line = bytes(self._read_buffer[:count])
+        del self._read_buffer[:count]
+        return line
+
+    @property
+    def out_waiting(self) -> int:
+        """Number of written bytes not yet sent, as of the last time data was handed to the OS.
+        Cheap enough to check before every write; flush() brings it up to date."""
+        return len(self._write_buffer) + self._os_out_waiting
+
+    @property
+    def frames_per_write(self) -> float:
+        """Average number of write_nowait calls sent per OS write"""
+        return self.n_frames_written / max(1, self.n_write_syscalls)
+
+    def _raise_write_error(self):
+        error, self._write_error = self._write_error, None
+        raise error
+
+    def _write_buffered_nowait(self):
+        """Hand as much of the write buffer to the OS as it will take in one write"""
+        if self.tracer is not None:
+            start = trio.current_time()
         try:
-            while not line.endswith(terminator):
-                line.extend(self._read_bytes_nowait(1))
-                await trio.sleep(0.001)
-            return bytes(line)
-        except trio.Cancelled:
-            logging.exception(f"Abandoning data: {line}")
-            self._serial.cancel_read()
+            n = self._serial.write(self._write_buffer)
+        except Exception as e:
+            if not self._serial.is_open:
+                raise DeviceClosedException from e
             raise
+        self.n_write_syscalls += 1
+        # pyserial returns None when the write completed
+        if n is None:
+            n = len(self._write_buffer)
+        del self._write_buffer[:n]
+        if self.tracer is not None:
+            self.tracer.span("write", start, trio.current_time(), "serial", bytes=n)
+        self.n_bytes_written += n
+        self._os_out_waiting = self._serial.out_waiting
+        if self.max_out_waiting < self._os_out_waiting:
+            self.max_out_waiting = self._os_out_waiting
 
-    async def read_exactly(self, count):
-        line = bytearray()
-        while len(line) < count:
-            line.extend(self._read_bytes_nowait(count - len(line)))
-            await trio.sleep(0.001)
-        return bytes(line)
+    async def _wait_writable(self):
+        if self._fileno is None:
+            await trio.sleep(self._poll_interval)
+        else:
+            await trio.lowlevel.wait_writable(self._fileno)
+
+    async def _drain_write_buffer(self):
+        async with self._write_lock:
+            while self._write_buffer:
+                self._write_buffered_nowait()
+                if self._write_buffer:
+                    await self._wait_writable()
+
+    async def __aenter__(self):
+        self._nursery_manager = trio.open_nursery()
+        nursery = await self._nursery_manager.__aenter__()
+        nursery.start_soon(self._flusher, name=f"{self!r} flusher")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        nursery_manager, self._nursery_manager = self._nursery_manager, None
+        try:
+            await self.aclose()
+        finally:
+            # aclose cancelled the flusher, so this only waits for it to finish
+            suppressed = await nursery_manager.__aexit__(*exc_info)
+        return suppressed
+
+    async def _flusher(self):
+        with self._flusher_scope:
+            while True:
+                if not self._write_buffer:
+                    await self._flusher_lot.park()
+                if self.flush_delay_us:
+                    await trio.sleep(self.flush_delay_us / 1e6)
+                try:
+                    await self._drain_write_buffer()
+                except Exception as e:
+                    # there is no caller to raise this to, so hand it to the next writer
+                    self._write_error = e
+                    self._write_buffer.clear()
 
     def write_nowait(self, data):
-        self._serial.write(data)
-        if self._outbound_high_water <= self._serial.out_waiting:
-            warnings.warn(
-                "Outgoing buffer is backlogged. Data may be lost. {} bytes".format(
-                    self._serial.out_waiting
-                )
-            )
+        """Queue data to be written. Data queued in the same scheduler tick is sent in one write"""
+        if self._write_error is not None:
+            self._raise_write_error()
+        self._write_buffer += data
+        self.n_frames_written += 1
+        if self._nursery_manager is None:
+            # no flusher to leave it to
+            if not self._write_lock.locked():
+                self._write_buffered_nowait()
+        else:
+            self._flusher_lot.unpark_all()
 
     async def write(self, data):
-        self._serial.write(data)
-        if self._outbound_high_water <= self._serial.out_waiting:
-            warnings.warn(
-                "Outgoing buffer is backlogged. Data may be lost. {} bytes".format(
-                    self._serial.out_waiting
-                )
-            )
+        self.write_nowait(data)
         try:
             await self.flush()
-        except trio.Cancelled():
+        except trio.Cancelled:
             self._serial.cancel_write()
             raise
 
     async def flush(self, n_bytes=0):
         """wait until the number of queued outgoing bytes is less than or equal to n_bytes"""
         assert n_bytes >= 0
-        while self._serial.out_waiting > n_bytes:
-            await trio.sleep(0.001)
+        await self._drain_write_buffer()
+        if self._write_error is not None:
+            self._raise_write_error()
+        while True:
+            self._os_out_waiting = self._serial.out_waiting
+            excess = self._os_out_waiting - n_bytes
+            if excess <= 0:
+                break
+            # the OS can't tell us when its buffer drains, but it sends at the baud rate
+            await trio.sleep(excess * BITS_PER_BYTE / self._serial.baudrate)
 
     async def aclose(self):
+        self._flusher_scope.cancel()
         try:
             if self._serial.is_open:
                 await self.flush()
         finally:
+            if self._fileno is not None:
+                # wake any task blocked waiting on this file descriptor
+                trio.lowlevel.notify_closing(self._fileno)
+                self._fileno = None
             self._serial.close()
             assert not self._serial.is_open
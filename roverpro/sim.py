@@ -0,0 +1,260 @@
+"""A simulated Rover Pro on a pseudo-terminal, for testing and benchmarking without hardware.
+
+async with open_rover_simulator(version="1.10") as sim:
+    async with open_rover(sim.path) as rover:
+        ...
+"""
+
+import os
+import random
+from typing import Any, Dict, Optional, Union
+
+import trio
+from async_generator import asynccontextmanager
+
+from .rover_data import (
+    BatteryStatus,
+    DriveMode,
+    MOTOR_EFFORT_FORMAT,
+    MotorStatusFlag,
+    ROVER_DATA_ELEMENTS,
+    RoverFirmwareVersion,
+    SystemFaultFlag,
+)
+from .rover_protocol import CommandVerb, encode_packet, SERIAL_START_BYTE
+from .util import RoverException
+
+# start byte, left, right, flipper, verb, argument, checksum
+COMMAND_FRAME_LENGTH = 7
+
+# encoder counts per second when a motor is driven at full effort
+ENCODER_COUNTS_PER_SECOND = 1000
+# encoder interval is this divided by motor effort
+ENCODER_INTERVAL_AT_FULL_EFFORT = 50
+
+DEFAULT_VALUES = {
+    0: 1.0,
+    2: 0,
+    4: 0,
+    6: 500,
+    8: 500,
+    10: 0.1,
+    12: 0.1,
+    18: 0,
+    20: 35,
+    22: 35,
+    24: 15.0,
+    26: 15.0,
+    32: 0,
+    34: 0.9,
+    36: 0.9,
+    38: False,
+    42: 0.5,
+    44: 0.5,
+    46: 0,
+    48: 0.0,
+    50: DriveMode.OPEN_LOOP,
+    52: BatteryStatus.initialized | BatteryStatus.discharging,
+    54: BatteryStatus.initialized | BatteryStatus.discharging,
+    56: 0,
+    58: 0,
+    60: 25.0,
+    62: 25.0,
+    64: 15.0,
+    66: 15.0,
+    68: -0.5,
+    70: -0.5,
+    78: 0.0,
+    80: 0.0,
+    82: SystemFaultFlag.NONE,
+}
+
+
+def _parse_commands(buffer: bytearray):
+    """Remove and return all complete, checksum-valid command frames in the buffer"""
+    commands = []
+    start_byte = SERIAL_START_BYTE[0]
+    pos = 0
+    while True:
+        start = buffer.find(start_byte, pos)
+        if start < 0:
+            pos = len(buffer)
+            break
+        if len(buffer) < start + COMMAND_FRAME_LENGTH:
+            pos = start
+            break
+        payload = buffer[start + 1 : start + COMMAND_FRAME_LENGTH - 1]
+        if buffer[start + COMMAND_FRAME_LENGTH - 1] == 255 - sum(payload) % 255:
+            commands.append(bytes(payload))
+            pos = start + COMMAND_FRAME_LENGTH
+        else:
+            pos = start + 1
+    del buffer[:pos]
+    return commands
+
+
+class RoverSimulator:
+    def __init__(
+        self,
+        version: Union[str, RoverFirmwareVersion] = "1.10",
+        latency: float = 0.005,
+        jitter: float = 0.0,
+        drop_rate: float = 0.0,
+        drive_timeout: float = 0.5,
+        seed: Optional[int] = None,
+    ):
+        """Answers rover protocol commands like a Rover Pro running the given firmware version.
+        Data elements that version does not support get no response.
+        :param latency: seconds between receiving a request and sending its response
+        :param jitter: up to this many seconds of random delay is added to each response
+        :param drop_rate: fraction of requests to silently ignore
+        :param drive_timeout: motors stop if no command is received for this many seconds
+        """
+        if isinstance(version, str):
+            version = RoverFirmwareVersion.parse(version)
+        self.version = version
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.drive_timeout = drive_timeout
+        self._random = random.Random(seed)
+
+        # data element index -> python value. Motor-dependent values are computed on request.
+        self.values = dict(DEFAULT_VALUES)  # type: Dict[int, Any]
+        self.motor_efforts = [0.0, 0.0, 0.0]
+        self._encoder_counts = [0.0, 0.0]
+        self._last_update = None  # type: Optional[float]
+        self._last_command = None  # type: Optional[float]
+
+        # number of command frames received and of responses sent and dropped
+        self.n_commands = 0
+        self.n_responses = 0
+        self.n_dropped = 0
+
+        self.path = None  # type: Optional[str]
+        self._controller = None  # type: Optional[int]
+        self._outbox_send, self._outbox_receive = trio.open_memory_channel(float("inf"))
+
+    def _update_motors(self, now: float):
+        if self._last_command is not None and self._last_command + self.drive_timeout < now:
+            self.motor_efforts = [0.0, 0.0, 0.0]
+        if self._last_update is not None:
+            dt = now - self._last_update
+            for i in (0, 1):
+                self._encoder_counts[i] += self.motor_efforts[i] * ENCODER_COUNTS_PER_SECOND * dt
+        self._last_update = now
+
+    def get_value(self, index: int, now: float) -> Any:
+        """The python value the simulated rover would report for the given data element"""
+        self._update_motors(now)
+        left, right, flipper = self.motor_efforts
+        if index == 40:
+            return self.version
+        if index in (14, 16):
+            return int(self._encoder_counts[(index - 14) // 2]) % 0x10000
+        if index in (28, 30):
+            effort = abs(left if index == 28 else right)
+            return 0 if effort == 0 else round(ENCODER_INTERVAL_AT_FULL_EFFORT / effort)
+        if index in (72, 74, 76):
+            effort = self.motor_efforts[(index - 72) // 2]
+            # the right motor is mounted in reverse
+            reverse = effort > 0 if index == 74 else effort < 0
+            result = MotorStatusFlag.BRAKE if effort == 0 else MotorStatusFlag.NONE
+            if reverse:
+                result |= MotorStatusFlag.REVERSE
+            return result
+        return self.values[index]
+
+    def _respond_to(self, index: int, now: float) -> Optional[bytes]:
+        element = ROVER_DATA_ELEMENTS.get(index)
+        if element is None:
+            return None
+        if element.since_version is not None and self.version < element.since_version:
+            return None
+        if element.until_version is not None and element.until_version <= self.version:
+            return None
+        payload = element.data_format.pack(self.get_value(index, now))
+        return encode_packet(bytes([index]), payload)
+
+    def handle_command(self, command: bytes, now: float) -> Optional[bytes]:
+        """Act on a command frame payload and return the response frame, if any"""
+        self.n_commands += 1
+        self._update_motors(now)
+        self._last_command = now
+        self.motor_efforts = [MOTOR_EFFORT_FORMAT.unpack(command[i : i + 1]) for i in range(3)]
+        verb, arg = command[3], command[4]
+
+        if verb == CommandVerb.GET_DATA:
+            return self._respond_to(arg, now)
+        if verb == CommandVerb.SET_FAN_SPEED:
+            self.values[48] = self.values[78] = self.values[80] = arg / 240
+        elif verb == CommandVerb.CLEAR_SYSTEM_FAULT:
+            self.values[82] = SystemFaultFlag.NONE
+        return None
+
+    async def _receive_loop(self):
+        buffer = bytearray()
+        while True:
+            await trio.lowlevel.wait_readable(self._controller)
+            try:
+                buffer += os.read(self._controller, 4096)
+            except BlockingIOError:
+                continue
+            now = trio.current_time()
+            for command in _parse_commands(buffer):
+                response = self.handle_command(command, now)
+                if response is None:
+                    continue
+                if self._random.random() < self.drop_rate:
+                    self.n_dropped += 1
+                    continue
+                delay = self.latency + self._random.uniform(0, self.jitter)
+                self._outbox_send.send_nowait((now + delay, response))
+
+    async def _send_loop(self):
+        async for send_at, response in self._outbox_receive:
+            await trio.sleep_until(send_at)
+            while response:
+                try:
+                    n = os.write(self._controller, response)
+                except BlockingIOError:
+                    await trio.lowlevel.wait_writable(self._controller)
+                    continue
+                response = response[n:]
+            self.n_responses += 1
+
+    async def run(self, task_status=trio.TASK_STATUS_IGNORED):
+        """Create the pseudo-terminal and answer commands on it until cancelled"""
+        try:
+            import tty
+        except ImportError:
+            raise RoverException("The rover simulator requires pseudo-terminal support") from None
+
+        self._controller, peripheral = os.openpty()
+        try:
+            tty.setraw(peripheral)
+            os.set_blocking(self._controller, False)
+            self.path = os.ttyname(peripheral)
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(self._receive_loop)
+                nursery.start_soon(self._send_loop)
+                task_status.started()
+        finally:
+            # keep our end of the peripheral open until now, so a client closing the device
+            # doesn't hang up the terminal
+            trio.lowlevel.notify_closing(self._controller)
+            os.close(self._controller)
+            os.close(peripheral)
+
+
+@asynccontextmanager
+async def open_rover_simulator(**kwargs):
+    """Run a RoverSimulator for the duration of the context. Its serial device is at `.path`.
+    Keyword arguments are passed to RoverSimulator."""
+    simulator = RoverSimulator(**kwargs)
+    async with trio.open_nursery() as nursery:
+        await nursery.start(simulator.run)
+        try:
+            yield simulator
+        finally:
+            nursery.cancel_scope.cancel()
@@ -0,0 +1,75 @@
+import collections
+from typing import Any, Callable, Dict, NamedTuple
+
+import trio
+
+
+class DataSample(NamedTuple):
+    """A value of a data element, as received from the rover"""
+
+    index: int
+    value: Any
+    # trio.current_time() when the value was received
+    timestamp: float
+
+
+class Subscription:
+    def __init__(
+        self,
+        rates: Dict[int, float],
+        buffer_size: int,
+        on_close: Callable[["Subscription"], None],
+    ):
+        """A stream of samples of some data elements, to be consumed with `async for`.
+        Up to buffer_size samples are kept for the consumer. If it falls behind, the oldest
+        samples are discarded so the stream never blocks the reader."""
+        if buffer_size < 1:
+            raise ValueError("buffer_size must be positive")
+        for index, rate in rates.items():
+            if not rate > 0:
+                raise ValueError(f"Rate for data element {index} must be positive")
+        # data element index -> requested samples per second
+        self.rates = dict(rates)
+        # number of samples discarded because the consumer was too slow
+        self.n_dropped = 0
+        self._buffer = collections.deque(maxlen=buffer_size)
+        self._lot = trio.lowlevel.ParkingLot()
+        self._on_close = on_close
+        self._closed = False
+
+    def _push(self, sample: DataSample):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.n_dropped += 1
+        self._buffer.append(sample)
+        self._lot.unpark_all()
+
+    async def receive(self) -> DataSample:
+        """Return the oldest unread sample, waiting for one if necessary.
+        Raises trio.EndOfChannel once the subscription has been closed."""
+        while not self._buffer:
+            if self._closed:
+                raise trio.EndOfChannel
+            await self._lot.park()
+        return self._buffer.popleft()
+
+    def close(self):
+        """Stop requesting data for this subscription. Already-received samples may still be read"""
+        if not self._closed:
+            self._closed = True
+            self._lot.unpark_all()
+            self._on_close(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> DataSample:
+        try:
+            return await self.receive()
+        except trio.EndOfChannel:
+            raise StopAsyncIteration from None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
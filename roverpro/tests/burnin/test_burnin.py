@@ -17,7 +17,6 @@ async def control_robot(rover, left, right, flipper, duration):
     )
     t1 = monotonic()
     while True:
-        rover.send_speed()
         await trio.sleep(0.5)
         left_motor_encoder_interval = await rover.get_data(28)
         right_motor_encoder_interval = await rover.get_data(30)
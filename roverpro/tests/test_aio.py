@@ -0,0 +1,121 @@
+import asyncio
+import contextlib
+import os
+import threading
+
+import pytest
+import trio
+
+from roverpro import aio
+from roverpro.rover_data import RoverFirmwareVersion
+from roverpro.sim import open_rover_simulator
+from roverpro.util import RoverDeviceNotFound, UnsupportedDataElement
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudo-terminal")
+
+
+@contextlib.contextmanager
+def simulator_thread(**kwargs):
+    """Run a simulator in its own Trio run, since the asyncio thread gets the driver's"""
+    started = threading.Event()
+    state = {}
+
+    async def run():
+        async with open_rover_simulator(**kwargs) as sim:
+            state["sim"] = sim
+            state["token"] = trio.lowlevel.current_trio_token()
+            state["stop"] = trio.Event()
+            started.set()
+            await state["stop"].wait()
+
+    thread = threading.Thread(target=trio.run, args=(run,))
+    thread.start()
+    started.wait()
+    try:
+        yield state["sim"]
+    finally:
+        trio.from_thread.run_sync(state["stop"].set, trio_token=state["token"])
+        thread.join()
+
+
+def test_asyncio_rover():
+    async def main(path):
+        async with aio.open_rover(path) as rover:
+            assert threading.current_thread() is threading.main_thread()
+            assert rover.firmware_version == RoverFirmwareVersion(1, 10)
+            assert await rover.get_data(20) == 35
+            data = await rover.get_data_items([6, 8])
+            assert data == {6: 500, 8: 500}
+            snapshot = await rover.snapshot()
+            assert snapshot.errors == {}
+            with pytest.raises(UnsupportedDataElement):
+                await rover.get_data(50)
+            # asyncio and the driver can run concurrently
+            results = await asyncio.gather(*(rover.get_data(i) for i in (6, 8, 20)))
+            assert results == [500, 500, 35]
+
+            rover.set_fan_speed(0.5)
+            rover.set_motor_speeds(0.5, 0.5, 0)
+            await asyncio.sleep(0.1)
+            assert await rover.get_data(48) == 0.5
+            assert await rover.call(lambda: rover.rover.motor_speeds) == (0.5, 0.5, 0)
+
+            samples = []
+            async with rover.subscribe({14: 50}) as subscription:
+                async for sample in subscription:
+                    samples.append(sample)
+                    if len(samples) == 5:
+                        break
+            assert [s.index for s in samples] == [14] * 5
+
+            metrics = await rover.metrics()
+            assert metrics["requests"]["timeouts"] == 0
+
+    with simulator_thread(latency=0.001) as sim:
+        asyncio.run(main(sim.path))
+    assert sim.values[48] == 0.5
+
+
+def test_asyncio_cancellation():
+    async def main(path):
+        async with aio.open_rover(path) as rover:
+            task = asyncio.ensure_future(rover.get_data(20))
+            await asyncio.sleep(0)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            # the driver is still usable
+            assert await rover.get_data(20) == 35
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(rover.call(trio.sleep_forever), 0.05)
+
+    with simulator_thread(latency=0.05) as sim:
+        asyncio.run(main(sim.path))
+
+
+def test_asyncio_no_rover():
+    async def main():
+        async with aio.open_rover("/dev/nosuchdevice"):
+            pass
+
+    with pytest.raises(RoverDeviceNotFound):
+        asyncio.run(main())
+
+
+def test_asyncio_rover_closed():
+    async def main(path):
+        async with aio.open_rover(path) as rover:
+            subscription = rover.subscribe({14: 10})
+            await subscription.__aenter__()
+            pending = asyncio.ensure_future(rover.call(trio.sleep_forever))
+            await asyncio.sleep(0.05)
+        with pytest.raises(RuntimeError, match="closed"):
+            await pending
+        with pytest.raises(RuntimeError, match="closed"):
+            await rover.get_data(20)
+        with pytest.raises(RuntimeError, match="closed"):
+            rover.set_motor_speeds(0, 0, 0)
+        await subscription.aclose()
+
+    with simulator_thread() as sim:
+        asyncio.run(main(sim.path))
@@ -0,0 +1,29 @@
+import json
+import os
+
+import pytest
+
+from roverpro.benchmark import percentile, run_end_to_end, run_microbenchmarks
+
+
+def test_percentile():
+    assert percentile([1, 2, 3, 4, 5], 50) == 3
+    assert percentile([1, 2], 50) == 1.5
+    assert percentile([1, 2, 3], 100) == 3
+
+
+def test_microbenchmarks():
+    results = run_microbenchmarks(number=10)
+    assert "encode_packet" in results
+    assert "RoverProtocol.read_one" in results
+    assert all(0 < t < 0.01 for t in results.values())
+    json.dumps(results)
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudo-terminal")
+async def test_end_to_end():
+    results = await run_end_to_end(n_requests=20)
+    for name in ("get_data", "get_data_items"):
+        assert results[name]["p50_s"] <= results[name]["p99_s"]
+        assert results[name]["requests_per_s"] > 0
+    json.dumps(results)
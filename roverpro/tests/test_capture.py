@@ -0,0 +1,111 @@
+import math
+import os
+
+import pytest
+import trio
+
+from roverpro.capture import (
+    CapturedFrame,
+    FrameCapture,
+    FrameDirection,
+    load_columns,
+    read_capture,
+    ReplaySerial,
+)
+from roverpro.rover import open_rover
+from roverpro.rover_protocol import CommandEncoder, CommandVerb, RoverProtocol
+from roverpro.sim import open_rover_simulator
+
+
+def test_capture_ring_keeps_newest_frames(tmp_path):
+    path = str(tmp_path / "rover.cap")
+    encoder = CommandEncoder()
+    with FrameCapture(path, capacity=4) as capture:
+        for arg in range(6):
+            capture.record_outbound(encoder.encode(0, 0, 0, CommandVerb.GET_DATA, arg))
+        capture.record_inbound([(14, b"\x01\x02")])
+        # readable while still recording
+        frames = read_capture(path)
+    assert [f.direction for f in frames] == [FrameDirection.TO_ROVER] * 3 + [
+        FrameDirection.FROM_ROVER
+    ]
+    assert [f.payload for f in frames] == [
+        bytes([125, 125, 125, CommandVerb.GET_DATA, arg]) for arg in (3, 4, 5)
+    ] + [b"\x0e\x01\x02"]
+    assert frames[-1].encode() == b"\xfd\x0e\x01\x02\xee"
+    assert [f.timestamp for f in frames] == sorted(f.timestamp for f in frames)
+
+
+def test_read_capture_rejects_other_files(tmp_path):
+    path = tmp_path / "not.cap"
+    path.write_bytes(bytes(100))
+    with pytest.raises(ValueError):
+        read_capture(str(path))
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudo-terminal")
+async def test_capture_rover_traffic(tmp_path):
+    path = str(tmp_path / "rover.cap")
+    with FrameCapture(path) as capture:
+        async with open_rover_simulator() as sim:
+            async with open_rover(sim.path, capture=capture) as rover:
+                await rover.get_data(20)
+    frames = read_capture(path)
+    assert (FrameDirection.TO_ROVER, bytes([125, 125, 125, CommandVerb.GET_DATA, 20])) in [
+        (f.direction, f.payload) for f in frames
+    ]
+    assert (FrameDirection.FROM_ROVER, b"\x14\x00\x23") in [
+        (f.direction, f.payload) for f in frames
+    ]
+
+
+def _inbound_frames(n, interval):
+    return [
+        CapturedFrame(100 + i * interval, FrameDirection.FROM_ROVER, bytes([14, 0, i]))
+        for i in range(n)
+    ]
+
+
+async def test_replay_as_fast_as_possible():
+    serial = ReplaySerial(_inbound_frames(50, 1), speed=math.inf)
+    protocol = RoverProtocol(serial)
+    with trio.fail_after(1):
+        values = [(await protocol.read_one())[1] for _ in range(50)]
+        assert values == list(range(50))
+        with pytest.raises(trio.EndOfChannel):
+            await protocol.read_one()
+
+
+async def test_replay_at_speed(autojump_clock):
+    serial = ReplaySerial(_inbound_frames(11, 0.1), speed=2)
+    protocol = RoverProtocol(serial)
+    t0 = trio.current_time()
+    values = []
+    for _ in range(11):
+        values.append((await protocol.read_one())[1])
+        assert trio.current_time() - t0 == pytest.approx(values[-1] * 0.05)
+    assert values == list(range(11))
+
+    protocol.write_nowait(0, 0, 0, CommandVerb.GET_DATA, 40)
+    assert serial.written == [CommandEncoder().encode(0, 0, 0, CommandVerb.GET_DATA, 40)]
+
+
+def test_load_columns(tmp_path):
+    pytest.importorskip("numpy")
+    path = str(tmp_path / "rover.cap")
+    with FrameCapture(path, capacity=11) as capture:
+        capture.record_inbound([(14, b"\x00\x09")])
+        capture.record_outbound(CommandEncoder().encode(0, 0, 0, CommandVerb.GET_DATA, 14))
+        for i in range(3):
+            capture.record_inbound([(14, bytes([0, i])), (24, b"\x00\x3a"), (38, b"\xda\xda")])
+        capture.record_inbound([(72, b"\xff\xff")])
+    columns = load_columns(path)
+    frames = read_capture(path)
+
+    # the oldest frames were overwritten, and undecodable motor status is left out
+    assert columns.keys() == {14, 24, 38}
+    assert list(columns[14].values) == [0, 1, 2]
+    assert list(columns[24].values) == [1.0, 1.0, 1.0]
+    assert list(columns[38].values) == [True, True, True]
+    inbound_times = [f.timestamp for f in frames if f.payload[0] == 14]
+    assert list(columns[14].timestamps) == inbound_times
@@ -1,6 +1,11 @@
+import json
+import os
+
 import pytest
+import trio
 
 from roverpro.find_device import *
+from roverpro.sim import open_rover_simulator
 
 
 def test_ftdi_device_paths():
@@ -47,3 +52,94 @@ async def test_missing_device():
     with pytest.raises(RoverException):
         async with SerialTrio("/dev/nosuchdevice") as d2:
             pass
+
+
+pty_only = pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudo-terminal")
+
+
+class FakeComport:
+    manufacturer = "FTDI"
+    vid = 0x0403
+    pid = 0x6015
+
+    def __init__(self, device, serial_number):
+        self.device = device
+        self.serial_number = serial_number
+
+
+@pytest.fixture
+async def simulators():
+    """Two rovers that never answer, then one that does"""
+    async with open_rover_simulator(drop_rate=1) as dead1:
+        async with open_rover_simulator(drop_rate=1) as dead2:
+            async with open_rover_simulator(latency=0) as live:
+                yield dead1, dead2, live
+
+
+@pty_only
+async def test_open_rover_device_probes_in_parallel(simulators):
+    dead1, dead2, live = simulators
+    t0 = trio.current_time()
+    async with open_rover_device(dead1.path, dead2.path, live.path) as device:
+        assert device.port == live.path
+        assert trio.current_time() - t0 < 0.5
+    # dead rovers only answer when no other rover does
+    assert dead1.n_commands > 0
+
+
+@pty_only
+async def test_open_rover_device_remembers_port(simulators, monkeypatch, tmp_path):
+    dead1, dead2, live = simulators
+    cache_path = str(tmp_path / "ports.json")
+    fake_comports = [FakeComport(sim.path, f"SN{i}") for i, sim in enumerate(simulators)]
+    monkeypatch.setattr("roverpro.find_device.comports", lambda: fake_comports)
+
+    async with open_rover_device(cache_path=cache_path) as device:
+        assert device.port == live.path
+    with open(cache_path) as f:
+        assert json.load(f) == {"usb:0403:6015:SN2": {"device": live.path, "version": "1.10.0"}}
+
+    n_commands = dead1.n_commands
+    async with open_rover_device(cache_path=cache_path) as device:
+        assert device.port == live.path
+    assert dead1.n_commands == n_commands
+
+
+@pty_only
+async def test_open_rover_device_stale_cache(simulators, monkeypatch, tmp_path):
+    dead1, dead2, live = simulators
+    cache_path = str(tmp_path / "ports.json")
+    with open(cache_path, "w") as f:
+        json.dump({"usb:0403:6015:SN0": {"device": dead1.path, "version": "1.10.0"}}, f)
+    fake_comports = [FakeComport(live.path, "SN0")]
+    monkeypatch.setattr("roverpro.find_device.comports", lambda: fake_comports)
+
+    async with open_rover_device(cache_path=cache_path) as device:
+        assert device.port == live.path
+    with open(cache_path) as f:
+        assert json.load(f) == {"usb:0403:6015:SN0": {"device": live.path, "version": "1.10.0"}}
+
+
+@pty_only
+async def test_open_rover_device_follows_moved_device(simulators, monkeypatch, tmp_path):
+    dead1, dead2, live = simulators
+    cache_path = str(tmp_path / "ports.json")
+    with open(cache_path, "w") as f:
+        json.dump(
+            {
+                # the rover moved to another port, and a dead device now has its old one
+                "usb:0403:6015:SN0": {"device": dead1.path, "version": "1.10.0"},
+                # this device is gone
+                "usb:0403:6015:SN9": {"device": "/dev/nosuchdevice", "version": "1.10.0"},
+            },
+            f,
+        )
+    fake_comports = [FakeComport(dead1.path, "SN1"), FakeComport(live.path, "SN0")]
+    monkeypatch.setattr("roverpro.find_device.comports", lambda: fake_comports)
+
+    async with open_rover_device(cache_path=cache_path) as device:
+        assert device.port == live.path
+    # only the rover's current port was probed
+    assert dead1.n_commands == 0
+    with open(cache_path) as f:
+        assert json.load(f) == {"usb:0403:6015:SN0": {"device": live.path, "version": "1.10.0"}}
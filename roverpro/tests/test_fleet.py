@@ -0,0 +1,67 @@
+import os
+
+import pytest
+import trio
+from async_generator import asynccontextmanager
+
+from roverpro.fleet import open_rover_fleet
+from roverpro.rover_data import RoverFirmwareVersion
+from roverpro.sim import open_rover_simulator
+from roverpro.util import RoverDeviceNotFound
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudo-terminal")
+
+
+@asynccontextmanager
+async def open_simulators(*versions, **kwargs):
+    async with trio.open_nursery() as nursery:
+        simulators = []
+        for version in versions:
+            simulator = await nursery.start(_run_simulator, version, kwargs)
+            simulators.append(simulator)
+        try:
+            yield simulators
+        finally:
+            nursery.cancel_scope.cancel()
+
+
+async def _run_simulator(version, kwargs, task_status):
+    async with open_rover_simulator(version=version, **kwargs) as simulator:
+        task_status.started(simulator)
+        await trio.sleep_forever()
+
+
+async def test_fleet_opens_every_rover():
+    async with open_simulators("1.10", "1.10", "1.7") as sims:
+        ports = [sim.path for sim in sims]
+        async with open_rover_fleet("/dev/nosuchdevice", *ports) as fleet:
+            assert set(fleet) == set(ports)
+            assert fleet.versions[ports[2]] == RoverFirmwareVersion(1, 7)
+            assert set(fleet.with_version("1.10")) == set(ports[:2])
+            assert list(fleet.errors) == ["/dev/nosuchdevice"]
+
+            fleet.broadcast_speeds(0.5, 0.5, 0)
+            await trio.sleep(0.1)
+            data = await fleet.gather_data([20, 28])
+            assert set(data) == set(ports)
+            for items in data.values():
+                assert items[20] == 35
+                assert items[28] == pytest.approx(100, abs=2)
+        assert len(fleet) == 0
+
+
+async def test_fleet_probes_in_parallel():
+    # rovers that never answer take a full probe timeout each
+    async with open_simulators("1.10", "1.10", "1.10", drop_rate=1) as dead:
+        async with open_simulators("1.10") as live:
+            ports = [sim.path for sim in dead + live]
+            t0 = trio.current_time()
+            async with open_rover_fleet(*ports) as fleet:
+                assert list(fleet) == [live[0].path]
+            assert trio.current_time() - t0 < 2
+
+
+async def test_fleet_no_rovers():
+    with pytest.raises(RoverDeviceNotFound):
+        async with open_rover_fleet("/dev/nosuchdevice"):
+            pass
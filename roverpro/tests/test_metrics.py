@@ -0,0 +1,57 @@
+import math
+
+import pytest
+
+from roverpro.metrics import Histogram, RequestMetrics, utilization_percent
+
+
+def test_histogram():
+    histogram = Histogram([1, 2, 5])
+    for value in [0.5, 1, 1.5, 3, 3, 10]:
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 2, 1]
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(1) == 10
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 6
+    assert snapshot["mean"] == pytest.approx(19 / 6)
+    assert snapshot["max"] == 10
+    assert snapshot["buckets"] == [(1, 2), (2, 1), (5, 2), (math.inf, 1)]
+
+
+def test_empty_histogram():
+    snapshot = Histogram([1]).snapshot()
+    assert snapshot["count"] == 0
+    assert math.isnan(snapshot["mean"])
+    assert math.isnan(snapshot["p50"])
+
+
+def test_request_metrics():
+    metrics = RequestMetrics(rtt_buckets=[0.01, 0.1])
+    metrics.on_request(14, 1.0)
+    metrics.on_request(16, 1.0)
+    metrics.on_response(14, 1.005)
+    metrics.on_lost(16)
+    metrics.on_request(16, 1.1)
+    metrics.on_response(16, 1.15)
+    # unsolicited
+    metrics.on_response(16, 1.2)
+    metrics.on_request(20, 2)
+    metrics.on_timeout(20)
+
+    assert (metrics.n_requests, metrics.n_responses, metrics.n_lost, metrics.n_timeouts) == (
+        4,
+        3,
+        1,
+        1,
+    )
+    assert metrics.rtt_snapshot(14)["buckets"] == [(0.01, 1), (0.1, 0), (math.inf, 0)]
+    assert metrics.rtt_snapshot(16)["buckets"] == [(0.01, 0), (0.1, 1), (math.inf, 0)]
+    assert metrics.rtt_snapshot(20)["count"] == 0
+    assert metrics.rtt_snapshot()["buckets"] == [(0.01, 1), (0.1, 1), (math.inf, 0)]
+
+
+def test_utilization():
+    # 5760 bytes per second fill a 57600 baud line
+    assert utilization_percent(5760, 57600, 1) == pytest.approx(100)
+    assert utilization_percent(576, 57600, 2) == pytest.approx(5)
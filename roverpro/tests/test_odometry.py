@@ -0,0 +1,108 @@
+import math
+import os
+
+import pytest
+import trio
+
+from roverpro.odometry import open_odometry, Odometry, Pose, WheelGeometry
+from roverpro.rover import open_rover
+from roverpro.sim import ENCODER_COUNTS_PER_SECOND, open_rover_simulator
+
+GEOMETRY = WheelGeometry(meters_per_count=0.001, track_width=0.5, counts_per_second=1000)
+
+
+def feed(odometry, readings):
+    for t, (left, right) in enumerate(readings):
+        odometry.update(14, left % 0x10000, t)
+        odometry.update(16, right % 0x10000, t)
+
+
+def test_counts_unwrap():
+    odometry = Odometry(GEOMETRY)
+    feed(odometry, [(65000, 100), (65500, -400), (65936, -30000), (95536, -60000)])
+    assert odometry.left_count == 95536 - 65000
+    assert odometry.right_count == -60000 - 100
+    assert odometry.n_readings == 8
+
+
+def test_straight_line():
+    odometry = Odometry(GEOMETRY)
+    feed(odometry, [(65000 + 200 * i, 200 * i) for i in range(10)])
+    assert odometry.pose == Pose(pytest.approx(1.8), pytest.approx(0), pytest.approx(0), 9)
+
+
+def test_turn_in_place():
+    odometry = Odometry(GEOMETRY)
+    # each side moves a quarter of the circle around the center of the rover
+    quarter = round(math.pi * GEOMETRY.track_width / 4 / GEOMETRY.meters_per_count)
+    feed(odometry, [(-quarter * i, quarter * i) for i in range(3)])
+    x, y, heading, _ = odometry.pose
+    assert (x, y) == (pytest.approx(0, abs=1e-9), pytest.approx(0, abs=1e-9))
+    assert abs(heading) == pytest.approx(math.pi, abs=0.01)
+
+
+def test_arc():
+    odometry = Odometry(GEOMETRY)
+    # drive a quarter circle of radius 1 m, counterclockwise, in small steps
+    steps = 100
+    inner = 0.75 * math.pi / 2 / GEOMETRY.meters_per_count
+    outer = 1.25 * math.pi / 2 / GEOMETRY.meters_per_count
+    feed(
+        odometry, [(round(inner * i / steps), round(outer * i / steps)) for i in range(steps + 1)]
+    )
+    x, y, heading, _ = odometry.pose
+    assert (x, y, heading) == (
+        pytest.approx(1, abs=0.01),
+        pytest.approx(1, abs=0.01),
+        pytest.approx(math.pi / 2, abs=0.01),
+    )
+
+
+def test_pose_waits_for_both_sides():
+    odometry = Odometry(GEOMETRY)
+    feed(odometry, [(0, 0)])
+    odometry.update(14, 100, 1)
+    odometry.update(14, 200, 2)
+    assert odometry.pose == Pose(0, 0, 0, None)
+    odometry.update(16, 200, 2)
+    assert odometry.pose.x == pytest.approx(0.2)
+
+
+def test_reset():
+    odometry = Odometry(GEOMETRY)
+    feed(odometry, [(0, 0), (100, 100)])
+    odometry.reset(Pose(x=5))
+    odometry.update(14, 200, 2)
+    odometry.update(16, 200, 2)
+    assert odometry.pose == Pose(pytest.approx(5.1), 0, 0, 2)
+    assert odometry.left_count == 200
+
+
+def test_polling_rate():
+    odometry = Odometry(GEOMETRY._replace(counts_per_second=100000), min_rate=5, max_rate=50)
+    assert odometry.polling_rate((0, 0, 1)) == 5
+    # at full effort, 4 readings per half range
+    assert odometry.polling_rate((-1, 0.5, 0)) == pytest.approx(100000 * 4 / 2**15)
+    odometry.left_speed = 1e6
+    assert odometry.polling_rate((0, 0, 0)) == 50
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudo-terminal")
+async def test_odometry_with_simulator():
+    geometry = GEOMETRY._replace(counts_per_second=ENCODER_COUNTS_PER_SECOND)
+    async with open_rover_simulator(latency=0.001) as sim:
+        async with open_rover(sim.path) as rover:
+            async with open_odometry(rover, geometry) as odometry:
+                await trio.sleep(0.2)
+                assert odometry.pose.x == pytest.approx(0)
+                rover.set_motor_speeds(0.5, 0.5, 0)
+                await trio.sleep(1)
+                rover.set_motor_speeds(0, 0, 0)
+                await trio.sleep(0.3)
+                count = sim.get_value(14, trio.current_time())
+    # about 1 s at half speed, depending on when the commands took effect
+    assert 400 < count < 600
+    assert odometry.left_count == odometry.right_count == count
+    assert odometry.pose.x == pytest.approx(count * geometry.meters_per_count)
+    assert odometry.pose.heading == pytest.approx(0)
+    assert odometry.n_readings >= 2 * 10 * 1.5
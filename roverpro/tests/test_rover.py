@@ -1,3 +1,4 @@
+import math
 import statistics
 
 import pytest
@@ -10,7 +11,7 @@ from roverpro.rover_data import (
     RoverFirmwareVersion,
     SystemFaultFlag,
 )
-from roverpro.rover import open_rover, Rover
+from roverpro.rover import DataBatch, open_rover, Rover
 from roverpro.util import RoverException, RoverDeviceNotFound
 
 
@@ -23,6 +24,70 @@ async def rover():
         pytest.skip("This test requires a rover device but none was found")
 
 
+def test_data_batch():
+    batch = DataBatch([16, 14, 16])
+    assert list(batch) == [14, 16]
+    assert len(batch) == 2 and 14 in batch and 40 not in batch
+    batch._set_value(16, 123, 1.5)
+    batch.errors[14] = RoverException("lost")
+    assert batch[14] is None and batch[16] == 123
+    assert math.isnan(batch.timestamp(14)) and batch.timestamp(16) == 1.5
+    assert list(batch.items()) == [(14, None), (16, 123)]
+
+    data = batch.to_dict()
+    assert data == {14: None, 16: 123}
+    assert data.timestamps == {16: 1.5}
+    assert data.errors.keys() == {14}
+
+    batch.clear()
+    assert batch[16] is None and math.isnan(batch.timestamp(16)) and batch.errors == {}
+    with pytest.raises(KeyError):
+        batch[40]
+
+
+class BackloggedDevice:
+    """A device whose outgoing buffer never drains"""
+
+    serial_kwargs = {}
+    tracer = None
+    out_waiting = 1000
+
+    def __init__(self):
+        self.written = []
+
+    def write_nowait(self, data):
+        self.written.append(data)
+
+    async def flush(self, n_bytes=0):
+        await trio.sleep_forever()
+
+
+async def test_keepalive_with_backlogged_device():
+    rover = Rover()
+    await rover.set_device(BackloggedDevice())
+    n_keepalives = 0
+    send_speed = rover.send_speed
+
+    def counting_send_speed():
+        nonlocal n_keepalives
+        n_keepalives += 1
+        # fail instead of hanging if the keepalive loop stops yielding
+        assert n_keepalives < 100
+        send_speed()
+
+    rover.send_speed = counting_send_speed
+    async with trio.open_nursery() as nursery:
+        await nursery.start(rover._write_loop)
+        await nursery.start(rover._keepalive_loop)
+        rover.set_motor_speeds(0.5, 0.5, 0)
+        await trio.sleep(0.35)
+        nursery.cancel_scope.cancel()
+    # one NOP per keepalive interval, each collapsing into the one still queued
+    assert 3 <= n_keepalives <= 5
+    assert len(rover._outbound) == 1
+    assert rover._device.written == []
+
+
 async def test_find_rover(rover):
     assert rover is not None
     assert isinstance(rover, Rover)
@@ -39,6 +104,21 @@ async def test_get_version(rover):
     assert 0 <= version.patch <= 100
 
 
+async def test_get_data_cached(rover):
+    version = await rover.get_data(40)
+    n_requests = rover._request_metrics.n_requests
+    with trio.fail_after(0.001):
+        # firmware version never changes, so this should not go to the rover
+        assert await rover.get_data(40) == version
+    assert rover._request_metrics.n_requests == n_requests
+    assert await rover.get_data(40, max_age=0) == version
+    assert rover._request_metrics.n_requests == n_requests + 1
+
+    rover.invalidate_cache()
+    assert await rover.get_data(40) == version
+    assert rover._request_metrics.n_requests == n_requests + 2
+
+
 async def test_recover_from_bad_data(rover):
     await rover._rover_protocol._serial.write(b"test" * 20)
 
@@ -52,6 +132,23 @@ async def test_recover_from_bad_data(rover):
     assert False
 
 
+async def test_concurrent_get_data(rover):
+    results = {}
+
+    async def get_repeatedly(index):
+        values = []
+        for _ in range(10):
+            values.append(await rover.get_data(index))
+        results[index] = values
+
+    async with trio.open_nursery() as nursery:
+        for index in (40, 14, 16, 28, 30):
+            nursery.start_soon(get_repeatedly, index)
+
+    assert all(isinstance(v, RoverFirmwareVersion) for v in results[40])
+    assert all(len(values) == 10 for values in results.values())
+
+
 async def test_missing_device():
     with pytest.raises(RoverException):
         async with open_rover("missing_device"):
@@ -108,6 +205,49 @@ async def test_get_all_data_elements(rover):
             assert v is not None
 
 
+async def test_get_data_items_all_elements(rover):
+    version = await rover.get_data(40)
+    indices = [i for i, de in ROVER_DATA_ELEMENTS.items() if de.supported(version)]
+
+    for _ in range(5):
+        data = await rover.get_data_items(indices)
+        assert data.errors == {}
+        assert sorted(data.keys()) == sorted(indices)
+        assert all(v is not None for v in data.values())
+
+
+async def test_snapshot(rover):
+    version = await rover.get_data(40)
+    indices = [i for i, de in ROVER_DATA_ELEMENTS.items() if de.supported(version)]
+
+    for _ in range(5):
+        snapshot = await rover.snapshot()
+        assert snapshot.errors == {}
+        assert sorted(snapshot.keys()) == sorted(indices)
+        assert snapshot.timestamps.keys() == snapshot.keys()
+        assert snapshot.skew < 0.5
+
+
+async def test_subscribe(rover):
+    counts = {14: 0, 16: 0, 40: 0}
+    with rover.subscribe({14: 40, 16: 40}) as fast, rover.subscribe({14: 10, 40: 5}) as slow:
+        with trio.move_on_after(1):
+            async with trio.open_nursery() as nursery:
+                for subscription in (fast, slow):
+
+                    async def consume(s=subscription):
+                        async for sample in s:
+                            assert sample.timestamp <= trio.current_time()
+                            counts[sample.index] += 1
+
+                    nursery.start_soon(consume)
+
+    # 14 is shared, so both subscribers receive every value
+    assert 60 <= counts[14] <= 100
+    assert 30 <= counts[16] <= 50
+    assert 3 <= counts[40] <= 7
+
+
 @pytest.mark.motor
 async def test_overspeed_fault(rover):
     v = await rover.get_data(40)
@@ -0,0 +1,135 @@
+import enum
+
+import pytest
+
+from roverpro.rover_data import (
+    BatteryStatus,
+    DataFormatBatteryStatus,
+    DataFormatChargerState,
+    MotorStatusFlag,
+    ROVER_DATA_DECODERS,
+    ROVER_DATA_ELEMENTS,
+    RoverFirmwareVersion,
+    supported_elements,
+    SystemFaultFlag,
+)
+from roverpro.util import UnsupportedDataElement
+
+
+def unpack_or_error(unpack, b):
+    try:
+        return unpack(b)
+    except ValueError as e:
+        return type(e)
+
+
+@pytest.mark.parametrize("index", ROVER_DATA_ELEMENTS.keys())
+def test_compiled_decoder_matches_unpack(index):
+    data_format = ROVER_DATA_ELEMENTS[index].data_format
+    decoder = ROVER_DATA_DECODERS[index]
+    for i in range(0, 0x10000, 7):
+        b = i.to_bytes(2, "big")
+        assert unpack_or_error(decoder, b) == unpack_or_error(data_format.unpack, b)
+
+
+@pytest.mark.parametrize("index", ROVER_DATA_ELEMENTS.keys())
+def test_compiled_decoder_accepts_any_bytes(index):
+    decoder = ROVER_DATA_DECODERS[index]
+    for i in range(0, 0x10000, 0x101):
+        b = i.to_bytes(2, "big")
+        expected = unpack_or_error(decoder, b)
+        assert unpack_or_error(decoder, bytearray(b)) == expected
+        assert unpack_or_error(decoder, memoryview(b)) == expected
+
+
+def test_decoders_only_for_known_elements():
+    for index, decoder in enumerate(ROVER_DATA_DECODERS):
+        assert (decoder is None) == (index not in ROVER_DATA_ELEMENTS)
+
+
+@pytest.mark.parametrize(
+    ("index", "value"),
+    [
+        (40, RoverFirmwareVersion(1, 10, 0)),
+        (50, ROVER_DATA_ELEMENTS[50].data_format.python_type.CLOSED_LOOP),
+        (52, BatteryStatus.initialized | BatteryStatus.fully_charged),
+        (72, MotorStatusFlag.REVERSE | MotorStatusFlag.COAST),
+        (82, SystemFaultFlag.OVERCURRENT),
+        (38, True),
+        (68, -1.234),
+    ],
+)
+def test_pack_unpack_roundtrip(index, value):
+    data_format = ROVER_DATA_ELEMENTS[index].data_format
+    assert data_format.unpack(data_format.pack(value)) == value
+    assert ROVER_DATA_DECODERS[index](data_format.pack(value)) == value
+
+
+def test_battery_status_ignores_reserved_bits():
+    decoder = DataFormatBatteryStatus().compile_unpack()
+    assert decoder(bytes.fromhex("240f")) == BatteryStatus(0)
+
+
+def test_charger_state_decoder_accepts_any_bytes():
+    decoder = DataFormatChargerState().compile_unpack()
+    for b in (bytes.fromhex("dada"), bytes.fromhex("0000")):
+        for view in (b, bytearray(b), memoryview(b)):
+            assert decoder(view) is (b == bytes.fromhex("dada"))
+
+
+@pytest.mark.parametrize("index", ROVER_DATA_ELEMENTS.keys())
+def test_unpack_many_matches_unpack(index):
+    np = pytest.importorskip("numpy")
+    data_format = ROVER_DATA_ELEMENTS[index].data_format
+    packed = [i.to_bytes(2, "big") for i in range(0, 0x10000, 7)]
+    expected = [unpack_or_error(data_format.unpack, b) for b in packed]
+    if ValueError in expected:
+        with pytest.raises(ValueError):
+            data_format.unpack_many(b"".join(packed))
+        packed = [b for b, value in zip(packed, expected) if value is not ValueError]
+        expected = [value for value in expected if value is not ValueError]
+
+    values = data_format.unpack_many(np.frombuffer(b"".join(packed), np.uint8).reshape(-1, 2))
+    assert len(values) == len(expected)
+    python_type = type(expected[0])
+    if issubclass(python_type, enum.Flag):
+        # flags are unpacked as their integer values
+        values = [python_type(int(v)) for v in values]
+    assert list(values) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize(
+    ("version_str", "expected"),
+    [
+        ("1", RoverFirmwareVersion(1)),
+        ("1.10", RoverFirmwareVersion(1, 10)),
+        ("1.2.3", RoverFirmwareVersion(1, 2, 3)),
+        ("1.10-rc1", RoverFirmwareVersion(1, 10, prerelease="rc1")),
+        ("1.10.2-rc.1+g1234", RoverFirmwareVersion(1, 10, 2, build="g1234", prerelease="rc.1")),
+    ],
+)
+def test_parse_version(version_str, expected):
+    version = RoverFirmwareVersion.parse(version_str)
+    assert version == expected
+    assert str(version) == str(expected)
+
+
+def test_parse_invalid_version():
+    with pytest.raises(ValueError):
+        RoverFirmwareVersion.parse("1.x")
+
+
+def test_supported_elements():
+    supported = supported_elements(RoverFirmwareVersion(1, 7))
+    assert supported_elements(RoverFirmwareVersion(1, 7)) is supported
+    for index, element in ROVER_DATA_ELEMENTS.items():
+        assert (index in supported) == (element.not_implemented or element.supported("1.7"))
+        assert supported.decoders[index] is (
+            ROVER_DATA_DECODERS[index] if index in supported else None
+        )
+    # drive mode was removed in 1.7 and system faults added in 1.10
+    with pytest.raises(UnsupportedDataElement):
+        supported.check(50)
+    with pytest.raises(UnsupportedDataElement):
+        supported.check(82)
+    supported.check(14)
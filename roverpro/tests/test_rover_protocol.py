@@ -1,3 +1,4 @@
+import random
 import statistics
 
 import pytest
@@ -5,7 +6,16 @@ import trio
 
 from roverpro.find_device import open_rover_device
 from roverpro.rover_data import RoverFirmwareVersion
-from roverpro.rover_protocol import CommandVerb, RoverProtocol
+from roverpro.rover_data import MOTOR_EFFORT_FORMAT
+from roverpro.rover_protocol import (
+    CommandEncoder,
+    CommandQueue,
+    CommandVerb,
+    encode_packet,
+    FrameDecoder,
+    RoverProtocol,
+    SERIAL_START_BYTE,
+)
 from roverpro.util import RoverDeviceNotFound
 
 n = 100
@@ -82,3 +92,142 @@ async def test_responses_sequential(protocol):
             k, _ = await protocol.read_one()
         result_keys.append(k)
     assert keys == result_keys
+
+
+def test_frame_decoder_many_frames():
+    frames = [encode_packet(bytes([i]), i.to_bytes(2, "big")) for i in range(0, 84, 2)]
+    decoder = FrameDecoder()
+    assert decoder.feed(b"".join(frames)) == [(i, i.to_bytes(2, "big")) for i in range(0, 84, 2)]
+    assert decoder.n_bad_frames == 0
+    assert decoder.n_skipped_bytes == 0
+
+
+def test_frame_decoder_partial_frames():
+    data = encode_packet(bytes([40, 0x28, 0x6E])) * 2
+    decoder = FrameDecoder()
+    result = []
+    for b in data:
+        result.extend(decoder.feed(bytes([b])))
+    assert result == [(40, bytes([0x28, 0x6E]))] * 2
+
+
+def test_frame_decoder_resynchronizes():
+    good = encode_packet(bytes([40, 0x28, 0x6E]))
+    corrupt = SERIAL_START_BYTE + bytes([40, 0x28, 0x6E, 0])
+    decoder = FrameDecoder()
+    result = decoder.feed(b"junk" + corrupt + good + SERIAL_START_BYTE + good)
+    assert result == [(40, bytes([0x28, 0x6E]))] * 2
+    assert decoder.n_bad_frames == 2
+    assert decoder.n_skipped_bytes == len(b"junk") + len(corrupt) + 1
+
+
+class FakeSerial:
+    def __init__(self, *chunks):
+        self.chunks = list(chunks)
+
+    async def receive_some(self):
+        if not self.chunks:
+            await trio.sleep_forever()
+        return self.chunks.pop(0)
+
+
+async def test_read_one_skips_bad_frames():
+    good = encode_packet(bytes([40]), (10502).to_bytes(2, "big"))
+    bad = encode_packet(bytes([14]), bytes(2))[:-1] + b"\x00"
+    protocol = RoverProtocol(FakeSerial(bad + good[:2], good[2:] + good))
+    with trio.fail_after(1):
+        assert await protocol.read_one() == (40, RoverFirmwareVersion(1, 5, 2))
+        assert await protocol.read_one() == (40, RoverFirmwareVersion(1, 5, 2))
+
+
+async def test_read_many():
+    data = b"".join(encode_packet(bytes([i]), bytes(2)) for i in (28, 30, 14, 16))
+    protocol = RoverProtocol(FakeSerial(data))
+    with trio.fail_after(1):
+        assert await protocol.read_many() == [(28, 0), (30, 0), (14, 0), (16, 0)]
+
+
+def test_command_encoder_matches_encode_packet():
+    encoder = CommandEncoder()
+    rng = random.Random(0)
+    efforts = [-1, -0.5, 0, 0.1, 0.35, 1] + [rng.uniform(-1, 1) for _ in range(300)]
+    for _ in range(2000):
+        left, right, flipper = rng.choice(efforts), rng.choice(efforts), rng.choice(efforts)
+        verb = rng.choice(list(CommandVerb))
+        arg = rng.randrange(256)
+        expected = encode_packet(
+            MOTOR_EFFORT_FORMAT.pack(left),
+            MOTOR_EFFORT_FORMAT.pack(right),
+            MOTOR_EFFORT_FORMAT.pack(flipper),
+            bytes([verb, arg]),
+        )
+        assert encoder.encode(left, right, flipper, verb, arg) == expected
+        # and again, now that it's cached
+        assert encoder.encode(left, right, flipper, verb, arg) == expected
+
+
+def test_command_encoder_rejects_out_of_range_efforts():
+    encoder = CommandEncoder()
+    for effort in (-1.1, 1.1, 3):
+        with pytest.raises(Exception) as expected:
+            MOTOR_EFFORT_FORMAT.pack(effort)
+        with pytest.raises(expected.type):
+            encoder.encode(effort, 0, 0, CommandVerb.NOP, 0)
+
+
+def test_command_encoder_reuses_frames():
+    encoder = CommandEncoder()
+    frame = encoder.encode(0.5, 0.5, 0, CommandVerb.GET_DATA, 40)
+    assert encoder.encode(0.5, 0.5, 0, CommandVerb.GET_DATA, 40) is frame
+
+
+def _drain(queue):
+    commands = []
+    while True:
+        try:
+            commands.append(queue.get_nowait())
+        except trio.WouldBlock:
+            return commands
+
+
+def test_command_queue_priority_and_collapsing():
+    queue = CommandQueue()
+    queue.put_nowait(CommandVerb.NOP, 0)
+    queue.put_nowait(CommandVerb.GET_DATA, 14)
+    queue.put_nowait(CommandVerb.SET_SPEED_LIMIT_PERCENT, 50)
+    queue.put_nowait(CommandVerb.GET_DATA, 16)
+    queue.put_nowait(CommandVerb.GET_DATA, 14)
+    queue.put_nowait(CommandVerb.NOP, 0)
+    queue.put_nowait(CommandVerb.COMMIT_SETTINGS, 0)
+    assert len(queue) == 5
+    assert queue.n_collapsed == 2
+    # the NOP is not needed since other frames carry the motor efforts
+    assert _drain(queue) == [
+        (CommandVerb.SET_SPEED_LIMIT_PERCENT, 50),
+        (CommandVerb.COMMIT_SETTINGS, 0),
+        (CommandVerb.GET_DATA, 14),
+        (CommandVerb.GET_DATA, 16),
+    ]
+    queue.put_nowait(CommandVerb.NOP, 0)
+    assert _drain(queue) == [(CommandVerb.NOP, 0)]
+
+
+async def test_command_queue_full():
+    queue = CommandQueue(max_requests=2)
+    queue.put_nowait(CommandVerb.GET_DATA, 14)
+    queue.put_nowait(CommandVerb.GET_DATA, 16)
+    with pytest.raises(trio.WouldBlock):
+        queue.put_nowait(CommandVerb.GET_DATA, 18)
+    # duplicates and settings are still accepted
+    queue.put_nowait(CommandVerb.GET_DATA, 14)
+    for _ in range(10):
+        queue.put_nowait(CommandVerb.SET_FAN_SPEED, 0)
+
+    with trio.move_on_after(0.01):
+        await queue.wait_space_available()
+        assert False, "queue should be full"
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(queue.wait_space_available)
+        await trio.sleep(0.01)
+        assert len(_drain(queue)) == 12
+    queue.put_nowait(CommandVerb.GET_DATA, 18)
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+import trio
+
+from roverpro.rover import open_rover
+from roverpro.scheduler import link_capacity, PollScheduler
+from roverpro.sim import open_rover_simulator
+
+
+def test_link_capacity():
+    assert link_capacity(57600) == pytest.approx(822.9, abs=0.1)
+
+
+def test_plan_within_budget():
+    scheduler = PollScheduler(capacity=100, headroom=1)
+    assert scheduler.plan({14: 50, 16: 20, 64: 1}) == {14: 50, 16: 20, 64: 1}
+
+
+def test_plan_degrades_by_priority():
+    scheduler = PollScheduler(capacity=100, headroom=1)
+    scheduler.declare(14, priority=10)
+    scheduler.declare(16, priority=10)
+    scheduler.declare(64, priority=1, min_rate=1)
+    assert scheduler.plan({14: 50, 16: 45, 40: 10, 64: 10}) == {14: 50, 16: 45, 64: 5}
+    # the lowest priority elements lose out: 64 is slowed down to what is left, and 40 dropped
+    assert scheduler.planned.keys() == {14, 16, 64}
+
+
+def test_plan_rejects_unaffordable_minimum():
+    scheduler = PollScheduler(capacity=100, headroom=0.5)
+    scheduler.declare(14, priority=10, min_rate=30)
+    scheduler.declare(16, priority=5, min_rate=30)
+    scheduler.declare(64, priority=1, min_rate=10)
+    # every element gets its minimum rate before any gets more
+    assert scheduler.plan({14: 50, 16: 50, 64: 50}) == {14: 40, 64: 10}
+    report = scheduler.report(0)
+    assert report[16] == {"priority": 5, "desired": 50, "planned": 0.0, "achieved": 0.0}
+
+
+def test_declare_notifies():
+    changes = []
+    scheduler = PollScheduler(on_change=lambda: changes.append(True))
+    scheduler.declare(14, priority=1)
+    assert changes == [True]
+    with pytest.raises(ValueError):
+        scheduler.declare(14, min_rate=-1)
+
+
+async def test_report_defaults_to_now():
+    scheduler = PollScheduler(window=1)
+    scheduler.plan({14: 10})
+    scheduler.on_sample(14, trio.current_time())
+    assert scheduler.report()[14]["achieved"] == 1
+    assert scheduler.achieved_rates() == {14: 1}
+
+
+def test_achieved_rates():
+    scheduler = PollScheduler(window=1)
+    for i in range(30):
+        scheduler.on_sample(14, i / 10)
+    assert scheduler.achieved_rates(2.9) == {14: 10}
+    assert scheduler.achieved_rates(3.4) == {14: 5}
+    assert scheduler.achieved_rates(10) == {14: 0}
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudo-terminal")
+async def test_scheduler_with_simulator():
+    async with open_rover_simulator(latency=0.001) as sim:
+        async with open_rover(sim.path) as rover:
+            scheduler = rover.poll_scheduler
+            scheduler.capacity = 60
+            scheduler.headroom = 1
+            scheduler.window = 1
+            scheduler.declare(14, priority=10)
+            scheduler.declare(40, priority=1, min_rate=20)
+            with rover.subscribe({14: 50, 16: 50, 40: 30}):
+                await trio.sleep(1.05)
+                report = rover.metrics()["polling"]
+    # element 40 keeps its minimum rate, and 14 gets the rest ahead of 16
+    assert [report[i]["planned"] for i in (14, 16, 40)] == [40, 0, 20]
+    assert report[14]["achieved"] == pytest.approx(40, abs=6)
+    assert report[16]["achieved"] == 0
+    assert report[40]["achieved"] == pytest.approx(20, abs=4)
@@ -0,0 +1,154 @@
+import os
+import time
+
+import pytest
+import trio
+
+from roverpro.serial_trio import SerialTrio
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudo-terminal")
+
+
+@pytest.fixture
+async def pty_pair():
+    import tty
+
+    controller, peripheral = os.openpty()
+    tty.setraw(peripheral)
+    path = os.ttyname(peripheral)
+    try:
+        async with SerialTrio(path) as device:
+            yield controller, device
+    finally:
+        os.close(peripheral)
+        os.close(controller)
+
+
+async def test_receive_some_drains_available_bytes(pty_pair):
+    controller, device = pty_pair
+    os.write(controller, b"abc")
+    os.write(controller, b"defgh")
+    await trio.sleep(0.01)
+    with trio.fail_after(1):
+        assert await device.receive_some() == b"abcdefgh"
+
+
+async def test_read_until_and_exactly(pty_pair):
+    controller, device = pty_pair
+    os.write(controller, b"xx\xfd123\xfdtail")
+    with trio.fail_after(1):
+        assert await device.read_until(b"\xfd") == b"xx\xfd"
+        assert await device.read_exactly(3) == b"123"
+        assert await device.read_until(b"\xfd") == b"\xfd"
+        assert await device.read_exactly(4) == b"tail"
+
+
+async def test_read_wakes_on_data(pty_pair):
+    controller, device = pty_pair
+
+    async def write_later():
+        await trio.sleep(0.05)
+        os.write(controller, b"\xfd\x28\x00\x01")
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(write_later)
+        with trio.fail_after(1):
+            assert await device.read_until(b"\xfd") == b"\xfd"
+            assert await device.read_exactly(3) == b"\x28\x00\x01"
+
+
+async def test_idle_reader_does_not_spin(pty_pair):
+    controller, device = pty_pair
+    wakeups = 0
+
+    class CountWakeups(trio.abc.Instrument):
+        def before_task_step(self, task):
+            nonlocal wakeups
+            wakeups += 1
+
+    instrument = CountWakeups()
+    cpu_before = time.process_time()
+    trio.lowlevel.add_instrument(instrument)
+    try:
+        with trio.move_on_after(0.2):
+            await device.receive_some()
+    finally:
+        trio.lowlevel.remove_instrument(instrument)
+    assert wakeups < 10
+    assert time.process_time() - cpu_before < 0.1
+
+
+def _read_available(fd, n):
+    data = b""
+    while len(data) < n:
+        data += os.read(fd, n - len(data))
+    return data
+
+
+async def test_writes_in_one_tick_are_coalesced(pty_pair):
+    controller, device = pty_pair
+    frames = [bytes([0xFD, i, 0, 0, 0, 0, 0]) for i in range(20)]
+    for frame in frames:
+        device.write_nowait(frame)
+    await trio.sleep(0.01)
+    assert _read_available(controller, 140) == b"".join(frames)
+    assert device.n_frames_written == 20
+    assert device.n_write_syscalls == 1
+    assert device.frames_per_write == 20
+
+
+async def test_flush_sends_buffered_writes(pty_pair):
+    controller, device = pty_pair
+    device.write_nowait(b"abc")
+    await device.flush()
+    device.write_nowait(b"def")
+    await device.flush()
+    assert device.n_write_syscalls == 2
+    assert _read_available(controller, 6) == b"abcdef"
+
+
+async def test_flush_delay(pty_pair):
+    controller, device = pty_pair
+    device.flush_delay_us = 20000
+    device.write_nowait(b"abc")
+    await trio.sleep(0.005)
+    device.write_nowait(b"def")
+    assert device.n_write_syscalls == 0
+    await trio.sleep(0.05)
+    assert device.n_write_syscalls == 1
+    assert _read_available(controller, 6) == b"abcdef"
+
+
+async def test_flusher_ends_with_device():
+    import tty
+
+    controller, peripheral = os.openpty()
+    tty.setraw(peripheral)
+    task = trio.lowlevel.current_task()
+    n_nurseries = len(task.child_nurseries)
+    try:
+        async with SerialTrio(os.ttyname(peripheral)) as device:
+            nursery = task.child_nurseries[-1]
+            assert [t.name for t in nursery.child_tasks] == [f"{device!r} flusher"]
+            device.write_nowait(b"abc")
+        assert len(task.child_nurseries) == n_nurseries
+        assert _read_available(controller, 3) == b"abc"
+    finally:
+        os.close(peripheral)
+        os.close(controller)
+
+
+async def test_write_nowait_outside_context_writes_immediately():
+    import tty
+
+    controller, peripheral = os.openpty()
+    tty.setraw(peripheral)
+    device = SerialTrio(os.ttyname(peripheral))
+    try:
+        device.write_nowait(b"abc")
+        assert device.n_write_syscalls == 1
+        assert _read_available(controller, 3) == b"abc"
+    finally:
+        await device.aclose()
+        os.close(peripheral)
+        os.close(controller)
@@ -0,0 +1,231 @@
+import json
+import os
+
+import pytest
+import trio
+
+from roverpro.rover import DataBatch, open_rover
+from roverpro.rover_data import ROVER_DATA_ELEMENTS, RoverFirmwareVersion
+from roverpro.sim import open_rover_simulator
+from roverpro.util import UnsupportedDataElement
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudo-terminal")
+
+
+@pytest.fixture
+async def simulator():
+    async with open_rover_simulator(version="1.10", latency=0.002) as sim:
+        yield sim
+
+
+@pytest.fixture
+async def rover(simulator):
+    async with open_rover(simulator.path) as r:
+        yield r
+
+
+async def test_get_version(rover, simulator):
+    assert await rover.get_data(40) == RoverFirmwareVersion(1, 10)
+
+
+async def test_all_supported_elements(rover, simulator):
+    for index, element in ROVER_DATA_ELEMENTS.items():
+        if element.supported(simulator.version):
+            value = await rover.get_data(index)
+            expected = simulator.get_value(index, trio.current_time())
+            # compare after a round trip through the data format, since it may lose precision
+            data_format = element.data_format
+            assert value == data_format.unpack(data_format.pack(expected))
+
+
+async def test_unsupported_element_fails_fast(rover, simulator):
+    n_commands = simulator.n_commands
+    # drive mode was removed in 1.7
+    with trio.fail_after(0.1):
+        with pytest.raises(UnsupportedDataElement):
+            await rover.get_data(50)
+        data = await rover.get_data_items([50, 82])
+    assert data.errors.keys() == {50}
+    assert isinstance(data.errors[50], UnsupportedDataElement)
+    with pytest.raises(UnsupportedDataElement):
+        rover.subscribe({50: 10})
+    assert simulator.n_commands == n_commands + 1
+
+
+@pytest.mark.parametrize("version", ["1.0", "1.4", "1.7", "1.10"])
+async def test_version_gating(version):
+    async with open_rover_simulator(version=version, latency=0) as sim:
+        async with open_rover(sim.path) as rover:
+            data = await rover.get_data_items(ROVER_DATA_ELEMENTS, timeout=0.2)
+    for i in ROVER_DATA_ELEMENTS:
+        element = ROVER_DATA_ELEMENTS[i]
+        supported = element.not_implemented or element.supported(sim.version)
+        assert (i not in data.errors) == supported
+
+
+async def test_motor_response(rover):
+    rover.set_motor_speeds(0.5, 0.5, 0)
+    rover.send_speed()
+    await trio.sleep(0.1)
+    data = await rover.get_data_items([28, 30])
+    assert data[28] == pytest.approx(100, abs=2)
+    assert data[30] == pytest.approx(100, abs=2)
+
+
+async def test_keepalive(rover, simulator):
+    # simulated motors stop 0.5 s after the last command
+    rover.set_motor_speeds(0.5, 0.5, 0)
+    await trio.sleep(1)
+    assert simulator.motor_efforts[:2] == [pytest.approx(0.5, abs=0.01)] * 2
+    n_commands = simulator.n_commands
+    assert 8 <= n_commands <= 12
+
+    # polling data resets the keepalive timer, so no NOPs are needed
+    with rover.subscribe({14: 50}):
+        await trio.sleep(0.5)
+    assert simulator.n_commands - n_commands <= 28
+
+    rover.set_motor_speeds(0, 0, 0)
+    await trio.sleep(0.2)
+    assert simulator.motor_efforts == [0, 0, 0]
+    n_commands = simulator.n_commands
+    # when stopped, no keepalives are needed
+    await trio.sleep(0.5)
+    assert simulator.n_commands == n_commands
+
+
+async def test_get_data_items_with_loss():
+    async with open_rover_simulator(latency=0.002, jitter=0.002, drop_rate=0.2, seed=0) as sim:
+        async with open_rover(sim.path) as rover:
+            indices = [i for i in ROVER_DATA_ELEMENTS if i != 50]
+            for _ in range(5):
+                data = await rover.get_data_items(indices, timeout=2)
+                assert data.errors == {}
+    assert sim.n_dropped > 0
+
+
+async def test_get_data_items_partial_result():
+    async with open_rover_simulator() as sim:
+        async with open_rover(sim.path) as rover:
+            sim.drop_rate = 1
+            with trio.fail_after(1):
+                data = await rover.get_data_items([14, 16], timeout=0.2)
+    assert data == {14: None, 16: None}
+    assert data.errors.keys() == {14, 16}
+
+
+async def test_concurrent_requests(rover):
+    results = {}
+
+    async def get_many(index):
+        results[index] = [await rover.get_data(index) for _ in range(20)]
+
+    async with trio.open_nursery() as nursery:
+        for index in (6, 8, 20, 28, 30):
+            nursery.start_soon(get_many, index)
+
+    assert results == {6: [500] * 20, 8: [500] * 20, 20: [35] * 20, 28: [0] * 20, 30: [0] * 20}
+
+
+async def test_subscribe(rover):
+    samples = []
+    with rover.subscribe({14: 50, 40: 10}) as subscription:
+        with trio.move_on_after(0.5):
+            async for sample in subscription:
+                samples.append(sample)
+    indices = [s.index for s in samples]
+    assert 20 <= indices.count(14) <= 30
+    assert 3 <= indices.count(40) <= 7
+    assert [s.timestamp for s in samples] == sorted(s.timestamp for s in samples)
+
+
+async def test_get_data_cached(rover, simulator):
+    await rover.get_data(40)
+    n_commands = simulator.n_commands
+    await rover.get_data(40)
+    await rover.get_data_items([40])
+    assert simulator.n_commands == n_commands
+
+
+async def test_invalidated_response_in_flight_is_not_cached(rover, simulator):
+    rover.invalidate_cache()
+    simulator.latency = 0.05
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(rover.get_data, 40)
+        await trio.sleep(0.01)
+        # e.g. the rover restarted, possibly into other firmware, before the response arrived
+        rover.invalidate_cache()
+    n_commands = simulator.n_commands
+    await rover.get_data(40)
+    assert simulator.n_commands == n_commands + 1
+    # but a response to a request sent since then is
+    await rover.get_data(40)
+    assert simulator.n_commands == n_commands + 1
+
+
+async def test_backlogged_commands_are_queued(rover, simulator):
+    # queue every command behind the previous one
+    rover.max_outbound_backlog = 0
+    results = []
+
+    async def get(index):
+        results.append(await rover.get_data(index))
+
+    async with trio.open_nursery() as nursery:
+        for _ in range(10):
+            nursery.start_soon(get, 20)
+        rover.set_motor_speeds(0.5, 0.5, 0)
+        rover.set_fan_speed(0.5)
+    assert results == [35] * 10
+    assert rover._outbound.n_collapsed > 0
+    assert simulator.n_commands < 11
+
+    await trio.sleep(0.05)
+    assert simulator.motor_efforts[:2] == [pytest.approx(0.5, abs=0.01)] * 2
+    assert simulator.values[48] == 0.5
+
+
+async def test_metrics(rover):
+    await rover.get_data_items([14, 16, 20])
+    await rover.get_data(14)
+    metrics = rover.metrics()
+    # the firmware version read while finding the device isn't requested again
+    assert metrics["link"]["frames_sent"] == metrics["requests"]["sent"] == 4
+    assert metrics["link"]["frames_received"] == metrics["requests"]["responses"] == 4
+    # byte counts also include the request for the firmware version made when opening the device
+    assert metrics["link"]["bytes_sent"] == 5 * 7
+    assert metrics["link"]["bytes_received"] == 5 * 5
+    # a pseudo-terminal is not limited to the baudrate, so utilization may exceed 100%
+    assert metrics["link"]["outbound_utilization_percent"] > 0
+    assert metrics["decoder"]["checksum_failures"] == 0
+    assert metrics["requests"]["timeouts"] == 0
+    assert metrics["rtt_s"][14]["count"] == 2
+    assert metrics["rtt_s"]["all"]["count"] == 4
+    assert metrics["rtt_s"]["all"]["p50"] >= 0.002
+    json.dumps(metrics)
+
+
+async def test_snapshot(rover, simulator):
+    snapshot = await rover.snapshot()
+    expected = [i for i, e in ROVER_DATA_ELEMENTS.items() if e.supported(simulator.version)]
+    assert sorted(snapshot) == expected
+    assert snapshot.errors == {}
+    assert snapshot.timestamps.keys() == snapshot.keys()
+    assert snapshot.firmware_version == simulator.version
+    # every request is sent at once, so the responses arrive close together
+    assert 0 < snapshot.skew < 0.05
+
+    # values are always fresh, even for elements which are usually cached
+    snapshot2 = await rover.snapshot([40, 14])
+    assert list(snapshot2) == [14, 40]
+    assert min(snapshot2.timestamps.values()) > max(snapshot.timestamps.values())
+
+
+async def test_get_data_batch(rover):
+    batch = DataBatch([14, 20, 50])
+    for _ in range(3):
+        assert await rover.get_data_batch(batch) is batch
+        assert batch[20] == 35
+        assert batch.timestamp(20) <= trio.current_time()
+        assert batch.errors.keys() == {50}
+    assert batch.to_dict() == await rover.get_data_items([14, 20, 50])
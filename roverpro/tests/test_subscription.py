@@ -0,0 +1,41 @@
+import pytest
+import trio
+
+from roverpro.subscription import DataSample, Subscription
+
+
+def test_subscription_rejects_bad_rates():
+    with pytest.raises(ValueError):
+        Subscription({14: 0}, 10, lambda s: None)
+    with pytest.raises(ValueError):
+        Subscription({14: 10}, 0, lambda s: None)
+
+
+async def test_subscription_drops_oldest():
+    subscription = Subscription({14: 10}, 3, lambda s: None)
+    for i in range(5):
+        subscription._push(DataSample(14, i, float(i)))
+    assert subscription.n_dropped == 2
+    assert [(await subscription.receive()).value for _ in range(3)] == [2, 3, 4]
+
+
+async def test_subscription_close_ends_iteration():
+    closed = []
+    received = []
+
+    with Subscription({14: 10, 16: 10}, 10, closed.append) as subscription:
+        subscription._push(DataSample(14, 1, 0.0))
+
+        async def consume():
+            async for sample in subscription:
+                received.append(sample)
+
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(consume)
+            await trio.sleep(0.01)
+            subscription._push(DataSample(16, 2, 0.0))
+            await trio.sleep(0.01)
+            subscription.close()
+
+    assert closed == [subscription]
+    assert [s.value for s in received] == [1, 2]
@@ -0,0 +1,77 @@
+import json
+import os
+
+import pytest
+import trio
+
+from roverpro.rover import open_rover
+from roverpro.sim import open_rover_simulator
+from roverpro.tracing import Tracer
+
+
+def test_tracer_request_lifecycle():
+    tracer = Tracer()
+    tracer.on_request_queued(14, 1.0)
+    tracer.on_request_queued(14, 1.5)
+    tracer.on_request_written(14, 2.0)
+    tracer.on_response(14, 3.0, 3.25)
+    tracer.on_delivered(14, 3.5)
+    # a response to a request we didn't see
+    tracer.on_response(16, 4.0, 4.0)
+
+    trace = tracer.to_json()
+    assert trace["traceEvents"][0] == {
+        "name": "thread_name",
+        "ph": "M",
+        "pid": os.getpid(),
+        "tid": 1,
+        "args": {"name": "GET_DATA 14"},
+    }
+    spans = {e["name"]: (e["ts"], e["dur"]) for e in trace["traceEvents"][1:]}
+    assert spans == {
+        "request": (1e6, 2.25e6),
+        "queued": (1e6, 1e6),
+        "in flight": (2e6, 1e6),
+        "decode": (3e6, 0.25e6),
+        "wake caller": (3.25e6, 0.25e6),
+    }
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudo-terminal")
+async def test_trace_rover(tmp_path):
+    tracer = Tracer()
+    async with open_rover_simulator(latency=0.005) as sim:
+        async with open_rover(sim.path, tracer=tracer) as rover:
+            await rover.get_data(14)
+            await rover.get_data_items([16, 20])
+
+    path = str(tmp_path / "trace.json")
+    tracer.export(path)
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+    tracks = {e["args"]["name"]: e["tid"] for e in events if e["ph"] == "M"}
+    spans = [e for e in events if e["ph"] == "X"]
+    for index in (14, 16, 20):
+        names = {e["name"] for e in spans if e["tid"] == tracks[f"GET_DATA {index}"]}
+        assert names == {"request", "queued", "in flight", "decode", "wake caller"}
+    assert all(5000 <= e["dur"] for e in spans if e["name"] == "in flight")
+    assert any(e["name"] == "write" for e in spans)
+    assert any(e["name"] == "scheduler delay" for e in spans)
+    assert any(name.endswith("_read_loop") for name in tracks)
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="requires a pseudo-terminal")
+async def test_trace_only_own_rover():
+    tracer = Tracer()
+
+    def n_scheduler_delays():
+        return sum(1 for e in tracer.events if e["name"] == "scheduler delay")
+
+    async with open_rover_simulator() as sim, open_rover_simulator() as other_sim:
+        async with open_rover(sim.path, tracer=tracer):
+            async with open_rover(other_sim.path) as other:
+                n = n_scheduler_delays()
+                for _ in range(5):
+                    await other.get_data(14)
+                # the traced rover's reader had nothing to do
+                assert n_scheduler_delays() == n
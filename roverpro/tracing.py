@@ -0,0 +1,128 @@
+"""Trace where the time goes in each request to the rover.
+
+tracer = Tracer()
+async with open_rover(tracer=tracer) as rover:
+    ...
+tracer.export("rover-trace.json")
+
+Load the exported file in ui.perfetto.dev or chrome://tracing. Each data element gets a track
+showing, for every request, how long it was queued, in flight, and being decoded, and how long
+the waiting caller took to wake up. Other tracks show serial writes and how long the reader task
+waited for the scheduler after being woken.
+"""
+
+import collections
+import json
+import os
+from typing import Any, Callable, Dict
+
+import trio
+
+
+class _SchedulerDelayInstrument(trio.abc.Instrument):
+    def __init__(self, tracer: "Tracer", task_filter: Callable[[trio.lowlevel.Task], bool]):
+        self._tracer = tracer
+        self._task_filter = task_filter
+        # task -> when it was last scheduled
+        self._scheduled_at = {}  # type: Dict[trio.lowlevel.Task, float]
+
+    def task_scheduled(self, task):
+        if self._task_filter(task):
+            self._scheduled_at[task] = trio.current_time()
+
+    def before_task_step(self, task):
+        scheduled_at = self._scheduled_at.pop(task, None)
+        if scheduled_at is not None:
+            self._tracer.span("scheduler delay", scheduled_at, trio.current_time(), task.name)
+
+    def task_exited(self, task):
+        self._scheduled_at.pop(task, None)
+
+
+class Tracer:
+    def __init__(self, max_events: int = 1000000):
+        """Records spans of time in Chrome trace event format, keeping the newest max_events.
+        Times are trio.current_time() values."""
+        self.events = collections.deque(maxlen=max_events)
+        self._pid = os.getpid()
+        # track name -> thread id used for it in the trace
+        self._tracks = {}  # type: Dict[str, int]
+        # data element index -> when a request for it was queued, written, and answered
+        self._queued_at = {}  # type: Dict[int, float]
+        self._written_at = {}  # type: Dict[int, float]
+        self._decoded_at = {}  # type: Dict[int, float]
+
+    def _track(self, name: str) -> int:
+        tid = self._tracks.get(name)
+        if tid is None:
+            tid = self._tracks[name] = len(self._tracks) + 1
+        return tid
+
+    def span(self, name: str, start: float, end: float, track: str, **args):
+        """Record that something took from start to end"""
+        self.events.append(
+            {
+                "name": name,
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": self._pid,
+                "tid": self._track(track),
+                "args": args,
+            }
+        )
+
+    def instrument(
+        self, task_filter: Callable[[trio.lowlevel.Task], bool] = lambda task: True
+    ) -> trio.abc.Instrument:
+        """A trio instrument which records how long tasks wait to run after being woken.
+        Add it with trio.lowlevel.add_instrument.
+        :param task_filter: only tasks for which this returns True are traced"""
+        return _SchedulerDelayInstrument(self, task_filter)
+
+    def on_request_queued(self, index: int, now: float):
+        if index not in self._queued_at or index in self._written_at:
+            # unless this was collapsed into a request still in the queue
+            self._queued_at[index] = now
+
+    def on_request_written(self, index: int, now: float):
+        self._queued_at.setdefault(index, now)
+        self._written_at[index] = now
+
+    def on_response(self, index: int, received: float, decoded: float):
+        """Record the life of the latest request for a data element, now that it was answered"""
+        written = self._written_at.pop(index, None)
+        if written is None:
+            # not a response to a request we know about
+            return
+        queued = min(self._queued_at.pop(index), written)
+        track = f"GET_DATA {index}"
+        self.span("request", queued, decoded, track, index=index)
+        self.span("queued", queued, written, track)
+        self.span("in flight", written, received, track)
+        self.span("decode", received, decoded, track)
+        self._decoded_at[index] = decoded
+
+    def on_delivered(self, index: int, now: float):
+        """Record that the caller waiting for a data element has its value"""
+        decoded = self._decoded_at.pop(index, None)
+        if decoded is not None:
+            self.span("wake caller", decoded, now, f"GET_DATA {index}")
+
+    def to_json(self) -> Dict[str, Any]:
+        """The trace, in Chrome trace event format"""
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self._pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for name, tid in self._tracks.items()
+        ]
+        return {"traceEvents": metadata + list(self.events), "displayTimeUnit": "ms"}
+
+    def export(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f)
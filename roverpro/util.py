@@ -9,3 +9,11 @@ class RoverDeviceNotFound(RoverException):
     def __init__(self, devices_and_failures: Iterable[Tuple[str, Exception]]):
         self.devices_and_failures = devices_and_failures
         super().__init__()
+
+
+class UnsupportedDataElement(RoverException):
+    def __init__(self, index: int, version):
+        """The connected rover's firmware does not respond to requests for the data element"""
+        self.index = index
+        self.version = version
+        super().__init__(f"Data element {index} is not supported by firmware version {version}")